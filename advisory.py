@@ -0,0 +1,79 @@
+"""Prompt construction and Gemini plumbing shared by the app and the batch CLI.
+
+Nothing here imports Streamlit, so batch_advisory.py can build exactly the
+prompts the chat builds without starting a script run.
+"""
+from functools import lru_cache
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+
+import metrics
+
+# Errors meaning the cached model was retired or this key lost access to it
+MODEL_RESOLUTION_ERRORS = ['404', 'not found', '403', 'permission']
+
+
+def settings_context(settings):
+    return (f"Context: User is a farmer in {settings.get('state')}. Crop: {settings.get('crop')}. Soil: {settings.get('soil_type')}. "
+            f"Water availability: {settings.get('water_condition', 'Good')}. Reply in {settings.get('language', 'English')}.")
+
+
+def build_prompt(prompt, settings):
+    return f"{settings_context(settings)}\nQuestion: {prompt}"
+
+
+def demo_answer(prompt, settings):
+    """Canned answer used instead of Gemini in demo mode"""
+    crop = settings.get('crop', 'your crop')
+    state = settings.get('state', 'your area')
+    return f"🌿 **AgroNova AI (Demo Mode)**\n\nBased on the current conditions for **{crop}** in **{state}**, here is the best approach for: *'{prompt}'*\n\n1. **Monitor Moisture:** Ensure your soil moisture is optimal before proceeding.\n2. **Organic Alternatives:** Consider natural treatments like Neem oil to preserve soil health.\n3. **Weather Tracking:** Keep an eye on the 48-hour forecast before applying fertilizers.\n\n*(Note: You are currently using Demo Mode. Turn this off in Settings to connect to the live Google AI).* "
+
+
+@lru_cache(maxsize=32)
+def gemini_clients(api_key):
+    """(model service, generative service) clients bound to `api_key`.
+
+    genai.configure() only sets a process-wide default key, which another
+    session may replace at any moment; these clients keep using this key.
+    """
+    options = {"api_key": api_key}
+    return glm.ModelServiceClient(client_options=options), glm.GenerativeServiceClient(client_options=options)
+
+
+def select_gemini_model(api_key):
+    """Asks Google which models this key may use and returns the best one's name (None if there are none)"""
+    with metrics.span("gemini.list_models") as list_span:
+        models = genai.list_models(client=gemini_clients(api_key)[0])
+        available_models = [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+        list_span.set(models=len(available_models))
+
+    if not available_models:
+        return None
+
+    target_model_name = next((m for m in available_models if '1.5-flash' in m), None)
+    if not target_model_name:
+        target_model_name = next((m for m in available_models if 'pro' in m), available_models[0])
+
+    return target_model_name.replace("models/", "")
+
+
+def gemini_model(api_key, model_name):
+    """A GenerativeModel that calls Gemini with `api_key`, whatever genai.configure() saw last"""
+    model = genai.GenerativeModel(model_name)
+    model._client = gemini_clients(api_key)[1]  # Else it adopts the default client on its first call
+    return model
+
+
+def is_model_resolution_error(error):
+    return any(code in str(error).lower() for code in MODEL_RESOLUTION_ERRORS)
+
+
+def format_gemini_error(e):
+    error_msg = str(e).lower()
+    if "429" in error_msg or "quota" in error_msg:
+        return f"❌ QUOTA ERROR DETAILS: {str(e)}"
+    elif "400" in error_msg or "invalid" in error_msg:
+        return "❌ API Key is invalid or expired. Please update it in the Settings tab."
+    else:
+        return f"❌ AI Connection Error: {str(e)}"
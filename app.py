@@ -2,12 +2,38 @@ from dotenv import load_dotenv
 import os
 import streamlit as st
 import google.generativeai as genai
-import requests
 import datetime
-from PIL import Image
+import time
+import uuid
+from contextlib import nullcontext
+import metrics
+from advisory import build_prompt, demo_answer, format_gemini_error, gemini_model, is_model_resolution_error, select_gemini_model
+from chat_history import ChatHistory
+from conversation import build_followup_prompt, estimate_tokens, extend_summary, summary_prompt
+from farmer_store import FarmerStore
+from plots import PlotTable, harvest_window, order
+from image_ingest import PhashIndex, ingest_image
+from catalog import CountryCatalog
+from translations import LANGUAGE_CODES, translate
+from prefetch import Prefetcher
+from scheduler import BACKGROUND, GeminiScheduler
+from weather import WeatherService, crop_alerts, location_alerts
+from response_cache import ResponseCache, make_cache_key
 
 # --- LOAD ENVIRONMENT VARIABLES ---
 load_dotenv()
+metrics.configure_from_env()
+DATA_DIR = os.getenv('AGRONOVA_DATA_DIR', '.agronova')
+CHAT_MEMORY_TURNS = int(os.getenv('AGRONOVA_CHAT_MEMORY_TURNS', 50)) # Older turns are read back from the farmer store
+CHAT_PAGE_SIZE = 20 # Messages rendered per "Load earlier" page
+HISTORY_PREVIEWS = 100 # Questions listed in the history panel
+CONTEXT_TURNS = int(os.getenv('AGRONOVA_CONTEXT_TURNS', 6)) # Newest turns a follow-up may carry verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv('AGRONOVA_CONTEXT_TOKENS', 1500)) # Summary + verbatim turns, estimated tokens
+SUMMARY_TOKENS = 250 # Cap on the rolling summary of older turns
+SUMMARY_FOLD_TURNS = 20 # Turns folded into the summary per model call
+PLOT_PAGE_SIZE = 25 # Plots per page in the multi-plot Profile view
+IMAGE_MAX_EDGE = int(os.getenv('AGRONOVA_IMAGE_MAX_EDGE', 1024)) # Uploads are downscaled to this long edge
+IMAGE_FORMAT = os.getenv('AGRONOVA_IMAGE_FORMAT', 'JPEG') # JPEG or WEBP
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -17,6 +43,34 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# --- FARMER STORE (settings + chat history that survive reloads) ---
+# Never written to the store: the API key stays in this session only
+UNSTORED_SETTINGS = {'gemini_key'}
+
+@st.cache_resource
+def get_farmer_store():
+    """One SQLite database (WAL) and one batched writer thread per server process"""
+    return FarmerStore(os.path.join(DATA_DIR, 'farmers.sqlite3'))
+
+def get_farmer_id():
+    # The id rides in the URL (?farmer=...), so a reload or bookmark finds the same farmer
+    farmer_id = st.query_params.get('farmer', '')
+    if not (farmer_id.isalnum() and len(farmer_id) <= 64):
+        farmer_id = uuid.uuid4().hex
+        st.query_params['farmer'] = farmer_id
+    return farmer_id
+
+def save_farmer_settings():
+    settings = {k: v for k, v in st.session_state.settings.items() if k not in UNSTORED_SETTINGS}
+    settings['sowing_date'] = settings['sowing_date'].isoformat()
+    get_farmer_store().save_settings(st.session_state.farmer_id, settings)
+
+def load_farmer_settings(farmer_id):
+    settings = get_farmer_store().load_settings(farmer_id) or {}
+    if 'sowing_date' in settings:
+        settings['sowing_date'] = datetime.date.fromisoformat(settings['sowing_date'])
+    return settings
+
 # --- SESSION STATE INITIALIZATION ---
 def init_session_state():
     default_settings = {
@@ -25,11 +79,15 @@ def init_session_state():
         'name': 'Saurav',
         'crop': 'Wheat', 'sowing_date': datetime.date.today() - datetime.timedelta(days=45),
         'gemini_key': os.getenv('GOOGLE_API_KEY', ''),
+        'stream_responses': True, 'prefetch_prompts': False,
     }
     
+    if 'farmer_id' not in st.session_state: st.session_state.farmer_id = get_farmer_id()
+
     # Bulletproof initialization: Fill in ANY missing keys
     if 'settings' not in st.session_state: 
-        st.session_state.settings = default_settings.copy()
+        # Read the farmer's saved settings once per session, not on every rerun
+        st.session_state.settings = {**default_settings, **load_farmer_settings(st.session_state.farmer_id)}
     else:
         for key, value in default_settings.items():
             if key not in st.session_state.settings:
@@ -37,19 +95,23 @@ def init_session_state():
 
     if 'page' not in st.session_state: st.session_state.page = 'Home'
     if 'searching' not in st.session_state: st.session_state.searching = False
-    if 'chat_history' not in st.session_state: st.session_state.chat_history = []
+    if 'session_id' not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = ChatHistory(get_farmer_store(), st.session_state.farmer_id, window=CHAT_MEMORY_TURNS)
+    if 'chat_visible' not in st.session_state: st.session_state.chat_visible = CHAT_PAGE_SIZE
     if 'show_history' not in st.session_state: st.session_state.show_history = False
     if 'show_news' not in st.session_state: st.session_state.show_news = False
     if 'uploaded_image' not in st.session_state: st.session_state.uploaded_image = None
+    if 'uploaded_file_id' not in st.session_state: st.session_state.uploaded_file_id = None
+    if 'pending_query' not in st.session_state: st.session_state.pending_query = None
     if 'settings_hash' not in st.session_state: st.session_state.settings_hash = str(default_settings)
+    if 'prefetched_for' not in st.session_state: st.session_state.prefetched_for = None
+    if 'token_usage' not in st.session_state: st.session_state.token_usage = {'requests': 0, 'prompt': 0, 'output': 0, 'last': None}
 
 init_session_state()
 
 # --- HELPER: TRANSLATIONS & CONSTANTS ---
-LANGUAGES = [
-    "English", "Hindi", "Marathi", "Gujarati", "Tamil", "Telugu", "Kannada", "Malayalam", 
-    "Bengali", "Punjabi", "Spanish", "French", "German", "Mandarin", "Arabic", "Russian", "Portuguese"
-]
+LANGUAGES = list(LANGUAGE_CODES)
 
 CROP_DURATIONS = {
     'Wheat': 120, 'Rice (Paddy)': 150, 'Maize (Corn)': 100, 'Sugarcane': 365,
@@ -57,46 +119,31 @@ CROP_DURATIONS = {
 }
 
 def t(key):
-    translations = {
-        'English': {'home': 'Home', 'profile': 'Profile', 'setting': 'Setting', 'search_placeholder': 'Ask anything about farming...', 'personalized_prompts': 'Personalized Prompts', 'weather': 'Weather', 'tips': 'Harvesting Tips', 'harvest': 'Harvest Countdown', 'seeds': 'Recommended Seeds', 'save': 'Save Settings', 'history': 'History', 'news': 'Local Ag News'},
-    }
-    lang = st.session_state.settings.get('language', 'English')
-    return translations.get(lang, translations['English']).get(key, key)
+    # Catalogs live in locales/ and are loaded once per language per process
+    return translate(key, st.session_state.settings.get('language', 'English'))
 
 # --- HELPER: API INTEGRATIONS ---
-@st.cache_data(ttl=86400)
-def get_countries_and_states():
-    try:
-        response = requests.get("https://countriesnow.space/api/v0.1/countries/states", timeout=5)
-        if response.status_code == 200:
-            data = response.json()['data']
-            return {item['name']: [state['name'] for state in item['states']] for item in data if item['states']}
-    except Exception: pass
-    return {"India": ["Maharashtra", "Punjab", "Gujarat"], "United States": ["California", "Texas"]}
-
-@st.cache_data(ttl=1800)
-def get_weather_warning(location):
-    try:
-        sanitized_loc = location.replace(" ", "+")
-        url = f"https://wttr.in/{sanitized_loc}?format=j1"
-        response = requests.get(url, timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            current_condition = data['current_condition'][0]['weatherDesc'][0]['value'].lower()
-            temp_c = float(data['current_condition'][0]['temp_C'])
-            
-            SEVERE_CONDITIONS = ['thunder', 'torrential', 'heavy rain', 'snow', 'blizzard', 'flood', 'storm']
-            
-            if any(cond in current_condition for cond in SEVERE_CONDITIONS):
-                return f"⚠️ SEVERE WEATHER ALERT: {current_condition.title()} detected in your area."
-            elif temp_c > 40:
-                return f"⚠️ HEATWAVE ALERT: Extreme temperatures ({temp_c}°C) detected."
-    except Exception: pass
-    return None
+@st.cache_resource
+def get_country_catalog():
+    """Bundled catalog (data/countries.json), loaded once per process on first use"""
+    return CountryCatalog()
+
+@st.cache_resource
+def get_weather_service():
+    """One background-refreshed forecast table per server process"""
+    return WeatherService(ttl=1800, timeout=3)
+
+def get_location_string(settings):
+    return f"{settings.get('state', 'Maharashtra')},{settings.get('country', 'India')}"
+
+def get_forecast(location):
+    """Parsed forecast series for the location (shared by the Home banner and the Profile card)"""
+    with metrics.span("weather.get"):
+        return get_weather_service().get(location)
 
-def configure_gemini():
+def configure_gemini(settings=None):
     # 1. Check if user typed it in the Settings page
-    key = st.session_state.settings.get('gemini_key')
+    key = (settings or st.session_state.settings).get('gemini_key')
     # 2. If not, check Streamlit Cloud Secrets
     if not key:
         try:
@@ -109,49 +156,206 @@ def configure_gemini():
         
     if key: 
         genai.configure(api_key=key)
-        return True
-    return False
+        return key
+    return None
+
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
+def resolve_gemini_model(api_key):
+    """Resolves the best model name once per API key and shares it across all sessions"""
+    model_name = select_gemini_model(api_key)
+    if model_name is None:
+        raise LookupError("no models") # Not cached: the key may gain access at any time
+    return model_name
 
-def get_gemini_response(prompt, image=None):
+def get_gemini_model(api_key):
+    """A model on its own client for this key (None if the key can use no model); building it makes no call"""
+    try:
+        return gemini_model(api_key, resolve_gemini_model(api_key))
+    except LookupError:
+        return None
+
+@st.cache_resource
+def get_response_cache():
+    """One answer cache per server process, shared by every session"""
+    return ResponseCache(
+        os.path.join(DATA_DIR, 'responses.sqlite3'),
+        ttl=int(os.getenv('AGRONOVA_RESPONSE_TTL', 86400)),
+        max_memory_entries=int(os.getenv('AGRONOVA_RESPONSE_CACHE_MEMORY', 512)),
+        max_disk_entries=int(os.getenv('AGRONOVA_RESPONSE_CACHE_DISK', 20000)),
+    )
+
+@st.cache_resource
+def get_scheduler():
+    """Every generate_content call in this process goes through one rate-limited scheduler"""
+    return GeminiScheduler(
+        requests_per_minute=int(os.getenv('AGRONOVA_GEMINI_RPM', 15)),
+        burst=int(os.getenv('AGRONOVA_GEMINI_BURST', 5)),
+    )
+
+@st.cache_resource
+def get_prefetcher():
+    """Background pool for prompt-answer prefetches, shared by every session"""
+    return Prefetcher(max_workers=int(os.getenv('AGRONOVA_PREFETCH_WORKERS', 2)))
+
+@st.cache_resource
+def get_phash_index():
+    """Recently seen photo hashes, shared so a repeat photo reuses its diagnosis"""
+    return PhashIndex()
+
+def build_followup(prompt, history):
+    """Prompt carrying the rolling summary plus the newest unsummarized turns that fit the budget"""
+    summary, covers = history.summary, history.summary_covers
+    start = max(covers, len(history) - CONTEXT_TURNS)
+    if start > covers:
+        # The background fold lags behind: carry the aged-out turns in a model-free summary instead of dropping them.
+        # It keeps only the newest lines, so one chunk is all that is worth reading.
+        summary = extend_summary(summary, history.page(max(covers, start - SUMMARY_FOLD_TURNS), start), SUMMARY_TOKENS)
+    turns = history.page(start, len(history))
+    return build_followup_prompt(prompt, st.session_state.settings, summary, turns, CONTEXT_TOKEN_BUDGET, CONTEXT_TURNS)
+
+def update_conversation_summary(history):
+    """Folds every turn that left the verbatim window into the rolling summary, in the background"""
+    stop = len(history) - CONTEXT_TURNS
+    if stop <= history.summary_covers:
+        return
+
+    model, api_key = None, None
+    if not st.session_state.settings.get('demo_mode', False):
+        api_key = configure_gemini()
+        try:
+            model = get_gemini_model(api_key) if api_key else None
+        except Exception:
+            pass
+    scheduler = get_scheduler()
+
+    def fold(previous, turns, use_model):
+        if use_model and model is not None:
+            try:
+                text = scheduler.submit(api_key, lambda: model.generate_content(summary_prompt(previous, turns, SUMMARY_TOKENS)).text, priority=BACKGROUND).strip()
+                if text and estimate_tokens(text) <= 2 * SUMMARY_TOKENS:
+                    return text
+            except Exception:
+                pass # Shed or failed: the model-free fold still moves the summary forward
+        return extend_summary(previous, turns, SUMMARY_TOKENS)
+
+    def summarize(_):
+        # Catch up in bounded chunks; turns are read here, off the script thread.
+        # Only the newest chunk gets a model call, so an old backlog never drains the key's quota.
+        while history.summary_covers < stop:
+            previous, start = history.summary, history.summary_covers
+            chunk_stop = min(stop, start + SUMMARY_FOLD_TURNS)
+            history.set_summary(fold(previous, history.page(start, chunk_stop), use_model=chunk_stop == stop), chunk_stop)
+
+    owner = f"summary:{history.farmer_id}"
+    get_prefetcher().submit_batch(owner, [(f"{owner}:{stop}", None)], fn=summarize, on_result=lambda key, _: None)
+
+def record_token_usage(prompt_tokens, output_tokens):
+    usage = st.session_state.token_usage
+    usage['requests'] += 1
+    usage['prompt'] += prompt_tokens
+    usage['output'] += output_tokens
+    usage['last'] = (prompt_tokens, output_tokens)
+
+def await_pending_answer(pending, cache, cache_key):
+    """Wait for another generation of `cache_key`, then return its cached answer (None if it failed)"""
+    try:
+        pending.result(timeout=60)
+    except Exception:
+        pass
+    cached = cache.get(cache_key)
+    metrics.span("gemini.answer", cache="coalesced").finish(outcome="ok" if cached is not None else "miss")
+    return cached
+
+def stream_gemini_response(prompt, image=None, history=None):
+    """Yields the answer in chunks as Gemini generates it; with `history`, the conversation goes along"""
     # --- DEMO MODE BYPASS ---
     if st.session_state.settings.get('demo_mode', False):
-        import time
-        time.sleep(1.5) # Simulate AI thinking
-        crop = st.session_state.settings.get('crop', 'your crop')
-        state = st.session_state.settings.get('state', 'your area')
-        return f"🌿 **AgroNova AI (Demo Mode)**\n\nBased on the current conditions for **{crop}** in **{state}**, here is the best approach for: *'{prompt}'*\n\n1. **Monitor Moisture:** Ensure your soil moisture is optimal before proceeding.\n2. **Organic Alternatives:** Consider natural treatments like Neem oil to preserve soil health.\n3. **Weather Tracking:** Keep an eye on the 48-hour forecast before applying fertilizers.\n\n*(Note: You are currently using Demo Mode. Turn this off in Settings to connect to the live Google AI).* "
-
-    if not configure_gemini(): 
-        return "⚠️ No API Key found. Please paste it in the Settings tab."
-    try:
-        # Ask Google exactly which models this API key is allowed to use
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        
-        if not available_models:
-            return "❌ AI Error: Your API key does not have access to any models in this region."
-            
-        target_model_name = next((m for m in available_models if '1.5-flash' in m), None)
-        if not target_model_name:
-            target_model_name = next((m for m in available_models if 'pro' in m), available_models[0])
-            
-        clean_model_name = target_model_name.replace("models/", "")
-        model = genai.GenerativeModel(clean_model_name)
-        
-        settings = st.session_state.settings
-        settings_context = f"Context: User is a farmer in {settings.get('state')}. Crop: {settings.get('crop')}. Soil: {settings.get('soil_type')}."
-        full_prompt = f"{settings_context}\nQuestion: {prompt}"
-        
-        response = model.generate_content([full_prompt, image]) if image else model.generate_content(full_prompt)
-        return response.text
-
-    except Exception as e: 
-        error_msg = str(e).lower()
-        if "429" in error_msg or "quota" in error_msg:
-            return f"❌ QUOTA ERROR DETAILS: {str(e)}" 
-        elif "400" in error_msg or "invalid" in error_msg:
-            return "❌ API Key is invalid or expired. Please update it in the Settings tab."
-        else:
-            return f"❌ AI Connection Error: {str(e)}"
+        for word in demo_answer(prompt, st.session_state.settings).split(" "):
+            time.sleep(0.02) # Simulate AI typing
+            yield word + " "
+        return
+
+    api_key = configure_gemini()
+    if not api_key: 
+        yield "⚠️ No API Key found. Please paste it in the Settings tab."
+        return
+
+    settings = st.session_state.settings
+    cache = get_response_cache()
+    scheduler = get_scheduler()
+    if history is not None and len(history):
+        # Follow-ups depend on the conversation, so they skip the shared answer cache
+        followup = build_followup(prompt, history)
+        full_prompt, estimated_tokens, cache_key = followup.prompt, followup.estimated_tokens, None
+    else:
+        full_prompt = build_prompt(prompt, settings)
+        estimated_tokens = estimate_tokens(full_prompt)
+
+        # Identical questions from farmers with the same context share one answer
+        image_hash = get_phash_index().canonical(image.phash) if image else None
+        cache_key = make_cache_key(settings, prompt, image_hash)
+        cached = cache.get(cache_key)
+        pending = get_prefetcher().inflight(cache_key)
+        if cached is None and pending is not None:
+            # A prefetch is already generating this answer: wait instead of asking twice
+            cached = await_pending_answer(pending, cache, cache_key)
+        elif cached is not None:
+            metrics.span("gemini.answer", cache="hit").finish(bytes_out=len(cached))
+        if cached is not None:
+            yield cached
+            return
+
+    with scheduler.leading(cache_key) if cache_key else nullcontext() as leader:
+        if leader is not None:
+            # Another session claimed this answer first: wait for it, then generate only if it failed
+            cached = await_pending_answer(leader, cache, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        for attempt in range(2):
+            streamed = []
+            gen_span = metrics.span("gemini.generate_content", cache="miss",
+                                    bytes_in=len(full_prompt.encode("utf-8")) + (len(image.data) if image else 0))
+            try:
+                model = get_gemini_model(api_key)
+                if model is None:
+                    gen_span.finish(outcome="no_model")
+                    yield "❌ AI Error: Your API key does not have access to any models in this region."
+                    return
+                
+                contents = [full_prompt, image.as_part()] if image else full_prompt
+                response = scheduler.submit(api_key, lambda: model.generate_content(contents, stream=True))
+                usage = None
+                for chunk in response:
+                    streamed.append(chunk.text)
+                    usage = getattr(chunk, 'usage_metadata', None) or usage # Reported on the final chunk
+                    yield chunk.text
+                answer = "".join(streamed)
+                # Prefer Gemini's own counts; fall back to the local estimate
+                prompt_tokens = getattr(usage, 'prompt_token_count', 0) or estimated_tokens
+                output_tokens = getattr(usage, 'candidates_token_count', 0) or estimate_tokens(answer)
+                record_token_usage(prompt_tokens, output_tokens)
+                gen_span.finish(bytes_out=len(answer.encode("utf-8")), tokens_in=prompt_tokens, tokens_out=output_tokens)
+
+            except Exception as e: 
+                gen_span.finish(outcome="partial" if streamed else "error")
+                if streamed: # Failed mid-answer: keep what already arrived
+                    yield f"\n\n{format_gemini_error(e)}"
+                    return
+                if attempt == 0 and is_model_resolution_error(e):
+                    resolve_gemini_model.clear(api_key) # Drop the stale model name and re-resolve once
+                    continue
+                yield format_gemini_error(e)
+                return
+
+            # Outside the try: a finished answer must never be followed by an error
+            if cache_key:
+                cache.set(cache_key, answer)
+            return
+
+def get_gemini_response(prompt, image=None, history=None):
+    return "".join(stream_gemini_response(prompt, image, history))
+
 def get_dynamic_prompts():
     """STATIC, ZERO-QUOTA PROMPTS"""
     crop = st.session_state.settings.get('crop', 'Wheat')
@@ -164,6 +368,51 @@ def get_dynamic_prompts():
         f"Common pest control for {crop}?"
     ]
 
+def prefetch_prompt_answers():
+    """Generate the personalized prompt answers in the background so a click is instant"""
+    settings = dict(st.session_state.settings)
+    signature = make_cache_key(settings, "")
+    if settings.get('demo_mode', False) or not settings.get('prefetch_prompts', False) or st.session_state.prefetched_for == signature:
+        return
+
+    api_key = configure_gemini(settings)
+    if not api_key:
+        return
+    st.session_state.prefetched_for = signature
+    try:
+        model = get_gemini_model(api_key)
+    except Exception:
+        return
+    if model is None:
+        return
+
+    cache = get_response_cache()
+    scheduler = get_scheduler()
+    jobs = []
+    for prompt in get_dynamic_prompts():
+        cache_key = make_cache_key(settings, prompt)
+        if not cache.contains(cache_key):
+            jobs.append((cache_key, build_prompt(prompt, settings)))
+    get_prefetcher().submit_batch(st.session_state.session_id, jobs,
+                                  fn=lambda full_prompt: scheduler.submit(api_key, lambda: model.generate_content(full_prompt).text, priority=BACKGROUND),
+                                  on_result=cache.set)
+
+def get_farm_plots():
+    """Imported plot table, or the single crop from Settings as a one-plot farm"""
+    if 'plots' not in st.session_state:
+        columns = get_farmer_store().load_plots(st.session_state.farmer_id)
+        st.session_state.plots = PlotTable.from_columns(columns) if columns else None
+    if st.session_state.plots is None:
+        return PlotTable.from_settings(st.session_state.settings)
+    return st.session_state.plots
+
+def set_farm_plots(plots):
+    st.session_state.plots = plots
+    get_farmer_store().save_plots(st.session_state.farmer_id, plots.to_columns() if plots else None)
+
+HARVEST_WINDOWS = {'All plots': None, 'Ready now': 0, 'Due in 7 days': 7, 'Due in 30 days': 30, 'Due in 90 days': 90}
+PLOT_SORTS = {'Harvest date': 'harvest', 'Progress': 'progress', 'Area': 'area', 'Crop': 'crop'}
+
 def get_harvesting_tips():
     """STATIC, ZERO-QUOTA HARVESTING TIPS"""
     crop = st.session_state.settings.get('crop', 'Wheat')
@@ -180,7 +429,24 @@ def get_harvesting_tips():
     }
     return tips_db.get(crop, f"Monitor {crop} moisture levels closely before harvest. Ensure equipment is serviced to prevent field losses.")
 
-def get_weather_data(): return {"temp": "28°C", "condition": "Partly Cloudy", "humidity": "65%"}
+def get_weather_data(location):
+    series = get_forecast(location)
+    if series is None:
+        return {"temp": "--", "condition": "Weather unavailable", "humidity": "--", "outlook": ""}
+    outlook = ""
+    if len(series.temp_c):
+        outlook = f"Next {len(series.temp_c) * series.step_hours // 24} days: {series.temp_c.min():.0f}–{series.temp_c.max():.0f}°C, {series.precip_mm.sum():.0f} mm rain"
+    return {"temp": f"{series.current['temp_c']:.0f}°C", "condition": series.current['condition'],
+            "humidity": f"{series.current['humidity']}%", "outlook": outlook}
+
+def get_weather_alerts(location):
+    """Location-wide alerts plus heatwave/frost alerts for the farm's plots still in the field"""
+    series = get_forecast(location)
+    if series is None:
+        return []
+    plots = get_farm_plots()
+    status = plots.status(CROP_DURATIONS)
+    return location_alerts(series) + crop_alerts(series, plots.crop, plots.sowing_date, status.harvest_date)
 
 def get_agri_news(): 
     return [
@@ -247,217 +513,299 @@ with c4:
     if st.button(t('setting'), use_container_width=True): st.session_state.page = 'Setting'; st.rerun()
 st.markdown("<br><br>", unsafe_allow_html=True)
 
-# ================= PAGE: HOME =================
-if st.session_state.page == 'Home':
-    
-    loc_string = f"{st.session_state.settings.get('state', 'Maharashtra')},{st.session_state.settings.get('country', 'India')}"
-    warning = get_weather_warning(loc_string)
-    if warning:
-        st.error(warning, icon="⛈️")
-
-    if not st.session_state.searching:
-        st.markdown(f"<h1 style='text-align: center; font-size: 5.5rem; font-family: serif; letter-spacing: 5px; text-shadow: 2px 4px 15px rgba(0,0,0,0.6);'>AGRO NOVA</h1>", unsafe_allow_html=True)
-        st.markdown(f"<p style='text-align: center; font-size: 1.2rem; margin-bottom: 50px; opacity: 0.9;'>Your AI Farming Tool for {st.session_state.settings.get('state', 'Maharashtra')}</p>", unsafe_allow_html=True)
-
-        with st.container():
-            col_hist, col_search, col_news = st.columns([1, 6, 1])
-            with col_hist:
-                st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
-                if st.button("⏱️", help="History"): st.session_state.update(searching=True, show_history=True, show_news=False); st.rerun()
-                st.markdown("</div>", unsafe_allow_html=True)
-            with col_search:
-                search_query = st.chat_input(t('search_placeholder'))
-                with st.expander("📷 Add Image for analysis", expanded=False):
-                     uploaded_file = st.file_uploader("", type=['png', 'jpg', 'jpeg'], label_visibility="collapsed")
-                     if uploaded_file:
-                         st.session_state.uploaded_image = Image.open(uploaded_file)
-                         st.image(st.session_state.uploaded_image, width=150)
-            with col_news:
-                st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
-                if st.button("🌍", help="News"): st.session_state.update(searching=True, show_news=True, show_history=False); st.rerun()
-                st.markdown("</div>", unsafe_allow_html=True)
-
-        if search_query:
-            st.session_state.update(searching=True, show_history=False, show_news=False)
-            with st.spinner("Analyzing..."):
-                response = get_gemini_response(search_query, st.session_state.uploaded_image)
-                st.session_state.chat_history.append([search_query, response])
-                st.session_state.uploaded_image = None
-            st.rerun()
-
-        st.markdown(f"<br><h4 style='text-align:center; color: #A3E635 !important; font-weight:400;'>{t('personalized_prompts')}</h4>", unsafe_allow_html=True)
-        p_cols = st.columns(4)
-        for i, prompt in enumerate(get_dynamic_prompts()):
-            with p_cols[i]:
-                 if st.button(prompt, use_container_width=True, key=f"p_{i}"):
-                     st.session_state.searching = True
-                     with st.spinner("Thinking..."):
-                        response = get_gemini_response(prompt)
-                        st.session_state.chat_history.append([prompt, response])
-                     st.rerun()
-
-    # --- POST-SEARCH / CHAT VIEW ---
+# --- HOME PANELS (fragments: a click inside one only redraws that panel) ---
+# Toggles use on_click so the state is set before the fragment redraws itself
+@st.fragment
+def weather_banner(loc_string):
+    for alert in get_weather_alerts(loc_string):
+        st.error(alert, icon="⛈️")
+
+@st.fragment
+def history_panel():
+    if st.session_state.show_history:
+        st.button("✖ Close", key="cl_h", use_container_width=True, on_click=st.session_state.update, kwargs={'show_history': False})
+        with st.container(height=550, border=True):
+            st.markdown(f"### {t('history')}")
+            for preview in st.session_state.chat_history.previews(HISTORY_PREVIEWS):
+                st.markdown(f"<div style='background:rgba(255,255,255,0.05); padding:10px; border-radius:10px; margin-bottom:10px;'><small>**Q:** {preview}...</small></div>", unsafe_allow_html=True)
     else:
-        show_h = st.session_state.show_history
-        show_n = st.session_state.show_news
-        
-        if show_h and show_n:
-            cols = st.columns([2.5, 7, 2.5]) 
-        elif show_h:
-            cols = st.columns([3, 8.5, 0.5])
-        elif show_n:
-            cols = st.columns([0.5, 8.5, 3])
+         st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
+         st.button("⏱️", key="op_h", on_click=st.session_state.update, kwargs={'show_history': True})
+         st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment
+def news_panel():
+    if st.session_state.show_news:
+        st.button("✖ Close", key="cl_n", use_container_width=True, on_click=st.session_state.update, kwargs={'show_news': False})
+        with st.container(height=550, border=True):
+            st.markdown(f"### {t('news')}")
+            for item in get_agri_news():
+                st.markdown(f"<div style='background:rgba(255,255,255,0.05); padding:10px; border-radius:10px; margin-bottom:10px;'><small>**{item['title']}**<br><span style='opacity:0.6;'>{item['source']}</span></small></div>", unsafe_allow_html=True)
+    else:
+         st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
+         st.button("🌍", key="op_n", on_click=st.session_state.update, kwargs={'show_news': True})
+         st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment
+def chat_panel():
+    history = st.session_state.chat_history
+    chat_box = st.container(height=550, border=True)
+    with chat_box:
+        if len(history) > st.session_state.chat_visible:
+            st.button("⬆ Load earlier", key="load_earlier", use_container_width=True,
+                      on_click=st.session_state.update, kwargs={'chat_visible': st.session_state.chat_visible + CHAT_PAGE_SIZE})
+        for user_msg, ai_msg in history.tail(st.session_state.chat_visible):
+            with st.chat_message("user"): st.write(user_msg)
+            with st.chat_message("assistant", avatar="🌿"): st.write(ai_msg)
+    new_query = st.chat_input("Ask follow-up...", key="chat_followup")
+    if new_query:
+        st.session_state.pending_query = [new_query, None, True]
+
+    if st.session_state.pending_query:
+        query, image, followup = st.session_state.pending_query
+        st.session_state.pending_query = None
+        context = history if followup else None # Home searches and prompt buttons start a new topic
+        with chat_box:
+            with st.chat_message("user"): st.write(query)
+            with st.chat_message("assistant", avatar="🌿"):
+                if st.session_state.settings.get('stream_responses', True):
+                    response = st.write_stream(stream_gemini_response(query, image, context))
+                else:
+                    with st.spinner("Thinking..."):
+                        response = get_gemini_response(query, image, context)
+                    st.write(response)
+        # Only the finished (or partial, on error) answer enters the history
+        history.append(query, response)
+        update_conversation_summary(history)
+        if st.session_state.show_history: st.rerun() # The open history list needs the new question
+
+page_span = metrics.span("page.render", page=st.session_state.page)
+try:
+    # ================= PAGE: HOME =================
+    if st.session_state.page == 'Home':
+    
+        loc_string = get_location_string(st.session_state.settings)
+        prefetch_prompt_answers()
+        weather_banner(loc_string)
+
+        if not st.session_state.searching:
+            st.markdown(f"<h1 style='text-align: center; font-size: 5.5rem; font-family: serif; letter-spacing: 5px; text-shadow: 2px 4px 15px rgba(0,0,0,0.6);'>AGRO NOVA</h1>", unsafe_allow_html=True)
+            st.markdown(f"<p style='text-align: center; font-size: 1.2rem; margin-bottom: 50px; opacity: 0.9;'>Your AI Farming Tool for {st.session_state.settings.get('state', 'Maharashtra')}</p>", unsafe_allow_html=True)
+
+            with st.container():
+                col_hist, col_search, col_news = st.columns([1, 6, 1])
+                with col_hist:
+                    st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
+                    if st.button("⏱️", help="History"): st.session_state.update(searching=True, show_history=True, show_news=False); st.rerun()
+                    st.markdown("</div>", unsafe_allow_html=True)
+                with col_search:
+                    search_query = st.chat_input(t('search_placeholder'))
+                    with st.expander("📷 Add Image for analysis", expanded=False):
+                         uploaded_file = st.file_uploader("", type=['png', 'jpg', 'jpeg'], label_visibility="collapsed")
+                         if uploaded_file and uploaded_file.file_id != st.session_state.uploaded_file_id:
+                             # Keep only compact re-encoded bytes, never the full-resolution photo
+                             st.session_state.uploaded_image = ingest_image(uploaded_file, IMAGE_MAX_EDGE, IMAGE_FORMAT)
+                             st.session_state.uploaded_file_id = uploaded_file.file_id
+                         if uploaded_file and st.session_state.uploaded_image:
+                             st.image(st.session_state.uploaded_image.data, width=150)
+                with col_news:
+                    st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
+                    if st.button("🌍", help="News"): st.session_state.update(searching=True, show_news=True, show_history=False); st.rerun()
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+            if search_query:
+                # The chat view answers it, so tokens can stream into the conversation
+                st.session_state.update(searching=True, show_history=False, show_news=False,
+                                        pending_query=[search_query, st.session_state.uploaded_image, False], uploaded_image=None)
+                st.rerun()
+
+            st.markdown(f"<br><h4 style='text-align:center; color: #A3E635 !important; font-weight:400;'>{t('personalized_prompts')}</h4>", unsafe_allow_html=True)
+            p_cols = st.columns(4)
+            for i, prompt in enumerate(get_dynamic_prompts()):
+                with p_cols[i]:
+                     if st.button(prompt, use_container_width=True, key=f"p_{i}"):
+                         st.session_state.update(searching=True, pending_query=[prompt, None, False])
+                         st.rerun()
+
+        # --- POST-SEARCH / CHAT VIEW ---
         else:
-            cols = st.columns([0.1, 11.8, 0.1])
-
-        with cols[0]:
-            if show_h:
-                if st.button("✖ Close", key="cl_h", use_container_width=True): st.session_state.show_history=False; st.rerun()
-                with st.container(height=550, border=True):
-                    st.markdown(f"### {t('history')}")
-                    for i, (user_msg, _) in enumerate(reversed(st.session_state.chat_history)):
-                        st.markdown(f"<div style='background:rgba(255,255,255,0.05); padding:10px; border-radius:10px; margin-bottom:10px;'><small>**Q:** {user_msg[:35]}...</small></div>", unsafe_allow_html=True)
-            else:
-                 st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
-                 if st.button("⏱️", key="op_h"): st.session_state.update(show_history=True, show_news=False); st.rerun()
-                 st.markdown("</div>", unsafe_allow_html=True)
-
-        with cols[1]:
-             with st.container(height=550, border=True):
-                 for user_msg, ai_msg in st.session_state.chat_history:
-                     with st.chat_message("user"): st.write(user_msg)
-                     with st.chat_message("assistant", avatar="🌿"): st.write(ai_msg)
-             new_query = st.chat_input("Ask follow-up...", key="chat_followup")
-             if new_query:
-                 with st.spinner("Thinking..."):
-                    response = get_gemini_response(new_query)
-                    st.session_state.chat_history.append([new_query, response])
-                 st.rerun()
-
-        with cols[2]:
-            if show_n:
-                if st.button("✖ Close", key="cl_n", use_container_width=True): st.session_state.show_news=False; st.rerun()
-                with st.container(height=550, border=True):
-                    st.markdown(f"### {t('news')}")
-                    for item in get_agri_news():
-                        st.markdown(f"<div style='background:rgba(255,255,255,0.05); padding:10px; border-radius:10px; margin-bottom:10px;'><small>**{item['title']}**<br><span style='opacity:0.6;'>{item['source']}</span></small></div>", unsafe_allow_html=True)
-            else:
-                 st.markdown("<div class='icon-btn'>", unsafe_allow_html=True)
-                 if st.button("🌍", key="op_n"): st.session_state.update(show_news=True, show_history=False); st.rerun()
-                 st.markdown("</div>", unsafe_allow_html=True)
-
-# ================= PAGE: PROFILE =================
-elif st.session_state.page == 'Profile':
-    col_p_left, col_p_right = st.columns([1, 2])
+            # Fixed widths so each panel can open, close and redraw on its own
+            cols = st.columns([2.5, 7, 2.5])
+            with cols[0]: history_panel()
+            with cols[1]: chat_panel()
+            with cols[2]: news_panel()
+
+    # ================= PAGE: PROFILE =================
+    elif st.session_state.page == 'Profile':
+        col_p_left, col_p_right = st.columns([1, 2])
     
-    current_crop = st.session_state.settings.get('crop', 'Wheat')
-
-    with col_p_left:
-        st.markdown(f"<div class='custom-card' style='text-align: center;'>", unsafe_allow_html=True)
-        st.image("https://cdn-icons-png.flaticon.com/512/3135/3135715.png", width=100)
-        st.markdown(f"<h3 style='margin-top:10px;'>{st.session_state.settings.get('name', 'Saurav')}</h3>", unsafe_allow_html=True)
-        st.markdown("<div style='text-align: left; margin-top: 20px;'>", unsafe_allow_html=True)
-        st.markdown(f"**📍 Location:** {st.session_state.settings.get('state', 'Maharashtra')}, {st.session_state.settings.get('country', 'India')}")
-        st.markdown(f"**🌱 Soil:** {st.session_state.settings.get('soil_type', 'Red Soil')}")
-        st.markdown(f"**🌾 Crop:** {current_crop}")
-        st.markdown("</div></div>", unsafe_allow_html=True)
-
-        with st.expander("✏️ Edit Name"):
-             new_name = st.text_input("Name", st.session_state.settings.get('name', 'Saurav'))
-             if st.button("Update"): st.session_state.settings['name'] = new_name; st.rerun()
-
-    with col_p_right:
-        st.markdown(f"<div class='custom-card'>", unsafe_allow_html=True)
-        w_data = get_weather_data()
-        c_w1, c_w2 = st.columns([1,3])
-        with c_w1: st.markdown(f"<h1 style='color:#A3E635 !important; font-size:3rem;'>{w_data['temp']}</h1>", unsafe_allow_html=True)
-        with c_w2: st.markdown(f"<h3>{t('weather')}</h3><p>{w_data['condition']}, Humidity: {w_data['humidity']}</p>", unsafe_allow_html=True)
-        st.markdown("---")
-
-        sowing_date = st.session_state.settings.get('sowing_date', datetime.date.today() - datetime.timedelta(days=45))
-        total_days = CROP_DURATIONS.get(current_crop, 120)
-        days_passed = (datetime.date.today() - sowing_date).days
-        days_remaining = max(0, total_days - days_passed)
-        progress = min(1.0, days_passed / total_days) if total_days > 0 else 0
-
-        c_h1, c_h2 = st.columns([1.5, 1])
-        with c_h1:
-             st.markdown(f"<h3>⏳ {t('harvest')}</h3>", unsafe_allow_html=True)
-             if days_remaining > 0:
-                 st.markdown(f"<h1 style='color:#A3E635 !important; font-size:3rem; margin:0;'>{days_remaining} Days</h1>", unsafe_allow_html=True)
-                 st.progress(progress)
-                 st.caption(f"Sown on: {sowing_date.strftime('%d %b %Y')}")
-             else:
-                 st.markdown(f"<h2 style='color:#A3E635 !important;'>Ready for Harvest!</h2>", unsafe_allow_html=True)
-        with c_h2:
-             st.markdown(f"<h3>🌾 {t('tips')}</h3>", unsafe_allow_html=True)
-             st.info(get_harvesting_tips()) # Instant load, no API call
-        st.markdown("</div>", unsafe_allow_html=True)
-
-# ================= PAGE: SETTING =================
-elif st.session_state.page == 'Setting':
-    st.markdown(f"<div class='custom-card'><h2 style='text-align:center;'>⚙️ {t('setting')}</h2></div>", unsafe_allow_html=True)
+        current_crop = st.session_state.settings.get('crop', 'Wheat')
+
+        with col_p_left:
+            st.markdown(f"<div class='custom-card' style='text-align: center;'>", unsafe_allow_html=True)
+            st.image("https://cdn-icons-png.flaticon.com/512/3135/3135715.png", width=100)
+            st.markdown(f"<h3 style='margin-top:10px;'>{st.session_state.settings.get('name', 'Saurav')}</h3>", unsafe_allow_html=True)
+            st.markdown("<div style='text-align: left; margin-top: 20px;'>", unsafe_allow_html=True)
+            st.markdown(f"**📍 Location:** {st.session_state.settings.get('state', 'Maharashtra')}, {st.session_state.settings.get('country', 'India')}")
+            st.markdown(f"**🌱 Soil:** {st.session_state.settings.get('soil_type', 'Red Soil')}")
+            st.markdown(f"**🌾 Crop:** {current_crop}")
+            st.markdown("</div></div>", unsafe_allow_html=True)
+
+            with st.expander("✏️ Edit Name"):
+                 new_name = st.text_input("Name", st.session_state.settings.get('name', 'Saurav'))
+                 if st.button("Update"): st.session_state.settings['name'] = new_name; save_farmer_settings(); st.rerun()
+
+            with st.expander("🗺️ Plots"):
+                 st.caption("CSV columns: name, crop, sowing_date (YYYY-MM-DD), area (ha), soil. Only crop and sowing_date are required.")
+                 plot_file = st.file_uploader("Import plots", type=["csv"], label_visibility="collapsed")
+                 if plot_file and st.button("Import"):
+                     try:
+                         imported = PlotTable.from_csv(plot_file.getvalue().decode("utf-8-sig"), st.session_state.settings.get('soil_type', 'Red Soil'))
+                     except (ValueError, UnicodeDecodeError) as e:
+                         st.error(f"Could not import plots: {e}")
+                     else:
+                         if len(imported): set_farm_plots(imported); st.rerun()
+                         else: st.error("Could not import plots: the file has no rows")
+                 if st.session_state.get('plots') is not None and st.button("Use single crop from Settings"):
+                     set_farm_plots(None); st.rerun()
+
+        with col_p_right:
+            st.markdown(f"<div class='custom-card'>", unsafe_allow_html=True)
+            w_data = get_weather_data(get_location_string(st.session_state.settings))
+            c_w1, c_w2 = st.columns([1,3])
+            with c_w1: st.markdown(f"<h1 style='color:#A3E635 !important; font-size:3rem;'>{w_data['temp']}</h1>", unsafe_allow_html=True)
+            with c_w2:
+                st.markdown(f"<h3>{t('weather')}</h3><p>{w_data['condition']}, Humidity: {w_data['humidity']}</p>", unsafe_allow_html=True)
+                if w_data['outlook']: st.caption(w_data['outlook'])
+            st.markdown("---")
+
+            plots = get_farm_plots()
+            status = plots.status(CROP_DURATIONS) # Every plot's countdown in one vectorized pass
+
+            c_h1, c_h2 = st.columns([1.5, 1])
+            with c_h1:
+                 st.markdown(f"<h3>⏳ {t('harvest')}</h3>", unsafe_allow_html=True)
+                 if len(plots) > 1:
+                     upcoming = status.days_remaining[~status.ready]
+                     next_harvest = f"next in {upcoming.min()} days" if upcoming.size else "none pending"
+                     st.markdown(f"<h1 style='color:#A3E635 !important; font-size:3rem; margin:0;'>{int(status.ready.sum())} / {len(plots)}</h1>", unsafe_allow_html=True)
+                     st.caption(f"Plots ready for harvest, {next_harvest}")
+                 elif status.days_remaining[0] > 0:
+                     st.markdown(f"<h1 style='color:#A3E635 !important; font-size:3rem; margin:0;'>{status.days_remaining[0]} Days</h1>", unsafe_allow_html=True)
+                     st.progress(float(status.progress[0]))
+                     st.caption(f"Sown on: {plots.sowing_date[0].item().strftime('%d %b %Y')}")
+                 else:
+                     st.markdown(f"<h2 style='color:#A3E635 !important;'>Ready for Harvest!</h2>", unsafe_allow_html=True)
+            with c_h2:
+                 st.markdown(f"<h3>🌾 {t('tips')}</h3>", unsafe_allow_html=True)
+                 st.info(get_harvesting_tips()) # Instant load, no API call
+
+            if len(plots) > 1:
+                st.markdown("---")
+                c_f1, c_f2 = st.columns(2)
+                window = HARVEST_WINDOWS[c_f1.selectbox("Harvest window", list(HARVEST_WINDOWS))]
+                sort_by = PLOT_SORTS[c_f2.selectbox("Sort by", list(PLOT_SORTS))]
+                mask = harvest_window(status, 0, window) if window is not None else None
+                rows = order(plots, status, by=sort_by, mask=mask)
+
+                page_count = max(1, -(-len(rows) // PLOT_PAGE_SIZE))
+                page_no = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1) if page_count > 1 else 1
+                rows = rows[(page_no - 1) * PLOT_PAGE_SIZE:page_no * PLOT_PAGE_SIZE]
+                st.dataframe({
+                    'Plot': plots.name[rows], 'Crop': plots.crop[rows], 'Soil': plots.soil[rows], 'Area (ha)': plots.area[rows],
+                    'Sown': plots.sowing_date[rows], 'Harvest': status.harvest_date[rows],
+                    'Days left': status.days_remaining[rows], 'Progress': status.progress[rows],
+                }, hide_index=True, use_container_width=True,
+                   column_config={'Progress': st.column_config.ProgressColumn(min_value=0.0, max_value=1.0)})
+            st.markdown("</div>", unsafe_allow_html=True)
+
+    # ================= PAGE: SETTING =================
+    elif st.session_state.page == 'Setting':
+        st.markdown(f"<div class='custom-card'><h2 style='text-align:center;'>⚙️ {t('setting')}</h2></div>", unsafe_allow_html=True)
     
-    country_dict = get_countries_and_states()
-    country_list = list(country_dict.keys())
+        catalog = get_country_catalog()
     
-    c_s1, c_s2 = st.columns(2)
+        c_s1, c_s2 = st.columns(2)
 
-    with c_s1:
-        st.markdown("<div class='custom-card'><h3>🌍 Location & Soil</h3>", unsafe_allow_html=True)
+        with c_s1:
+            st.markdown("<div class='custom-card'><h3>🌍 Location & Soil</h3>", unsafe_allow_html=True)
         
-        current_country = st.session_state.settings.get('country', 'India')
-        c_idx = country_list.index(current_country) if current_country in country_list else 0
-        sel_country = st.selectbox("Country", country_list, index=c_idx)
+            current_country = st.session_state.settings.get('country', 'India')
+            current_state = st.session_state.settings.get('state', 'Maharashtra')
+            c_idx = catalog.country_index(current_country, default=catalog.country_index(catalog.country_of(current_state)))
+            sel_country = st.selectbox("Country", catalog.countries, index=c_idx)
         
-        state_list = country_dict.get(sel_country, ["Select State"])
-        current_state = st.session_state.settings.get('state', 'Maharashtra')
-        s_idx = state_list.index(current_state) if current_state in state_list else 0
-        sel_state = st.selectbox("State/Region", state_list, index=s_idx)
+            state_list = catalog.states(sel_country) or ["Select State"]
+            s_idx = catalog.state_index(sel_country, current_state)
+            sel_state = st.selectbox("State/Region", state_list, index=s_idx)
         
-        soil_types = ['Red Soil', 'Black Cotton Soil', 'Alluvial Soil', 'Sandy Loam', 'Clayey', 'Laterite']
-        current_soil = st.session_state.settings.get('soil_type', 'Red Soil')
-        sel_soil = st.selectbox("Soil Type", soil_types, index=soil_types.index(current_soil) if current_soil in soil_types else 0)
+            soil_types = ['Red Soil', 'Black Cotton Soil', 'Alluvial Soil', 'Sandy Loam', 'Clayey', 'Laterite']
+            current_soil = st.session_state.settings.get('soil_type', 'Red Soil')
+            sel_soil = st.selectbox("Soil Type", soil_types, index=soil_types.index(current_soil) if current_soil in soil_types else 0)
         
-        water_conds = ['Excellent (Irrigated)', 'Good (Seasonal)', 'Average', 'Poor (Rainfed)', 'Very Bad']
-        current_water = st.session_state.settings.get('water_condition', 'Good')
-        sel_water = st.selectbox("Water Condition", water_conds, index=water_conds.index(current_water) if current_water in water_conds else 1)
-        st.markdown("</div>", unsafe_allow_html=True)
+            water_conds = ['Excellent (Irrigated)', 'Good (Seasonal)', 'Average', 'Poor (Rainfed)', 'Very Bad']
+            current_water = st.session_state.settings.get('water_condition', 'Good')
+            sel_water = st.selectbox("Water Condition", water_conds, index=water_conds.index(current_water) if current_water in water_conds else 1)
+            st.markdown("</div>", unsafe_allow_html=True)
 
-    with c_s2:
-        st.markdown("<div class='custom-card'><h3>🌾 Crop & Preferences</h3>", unsafe_allow_html=True)
+        with c_s2:
+            st.markdown("<div class='custom-card'><h3>🌾 Crop & Preferences</h3>", unsafe_allow_html=True)
         
-        crop_list = list(CROP_DURATIONS.keys())
-        current_crop = st.session_state.settings.get('crop', 'Wheat')
-        crop_idx = crop_list.index(current_crop) if current_crop in crop_list else 0
-        sel_crop = st.selectbox("Current Crop", crop_list, index=crop_idx)
+            crop_list = list(CROP_DURATIONS.keys())
+            current_crop = st.session_state.settings.get('crop', 'Wheat')
+            crop_idx = crop_list.index(current_crop) if current_crop in crop_list else 0
+            sel_crop = st.selectbox("Current Crop", crop_list, index=crop_idx)
         
-        default_date = datetime.date.today() - datetime.timedelta(days=45)
-        current_date = st.session_state.settings.get('sowing_date', default_date)
-        sel_date = st.date_input("Sowing Date", value=current_date, max_value=datetime.date.today())
+            default_date = datetime.date.today() - datetime.timedelta(days=45)
+            current_date = st.session_state.settings.get('sowing_date', default_date)
+            sel_date = st.date_input("Sowing Date", value=current_date, max_value=datetime.date.today())
 
-        st.markdown("---")
+            st.markdown("---")
         
-        current_lang = st.session_state.settings.get('language', 'English')
-        l_idx = LANGUAGES.index(current_lang) if current_lang in LANGUAGES else 0
-        sel_lang = st.selectbox("Language", LANGUAGES, index=l_idx)
-        st.caption("AI responses will automatically translate to your selected language.")
+            current_lang = st.session_state.settings.get('language', 'English')
+            l_idx = LANGUAGES.index(current_lang) if current_lang in LANGUAGES else 0
+            sel_lang = st.selectbox("Language", LANGUAGES, index=l_idx)
+            st.caption("AI responses will automatically translate to your selected language.")
         
-        st.markdown("<h4 style='margin-top:20px;'>🔑 API Configuration</h4>", unsafe_allow_html=True)
-        new_key = st.text_input("Gemini API Key", type="password", value=st.session_state.settings.get('gemini_key', ''))
-        st.markdown("<h4 style='margin-top:20px;'>🛠️ Developer Options</h4>", unsafe_allow_html=True)
-        demo_mode = st.toggle("Enable Demo Mode (Bypasses API Quota Limits)", value=st.session_state.settings.get('demo_mode', False))
-        st.caption("Your API key is required to use AI features.")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    st.markdown("<br>", unsafe_allow_html=True)
-    if st.button("💾 " + t('save'), use_container_width=True):
-        st.session_state.settings.update({
-            'country': sel_country, 'state': sel_state, 
-            'soil_type': sel_soil, 'water_condition': sel_water, 
-            'language': sel_lang, 'crop': sel_crop, 'sowing_date': sel_date,
-            'gemini_key': new_key
-        })
-        st.success("Settings Saved Successfully!")
-        get_weather_warning.clear() 
-        st.rerun()
+            st.markdown("<h4 style='margin-top:20px;'>🔑 API Configuration</h4>", unsafe_allow_html=True)
+            new_key = st.text_input("Gemini API Key", type="password", value=st.session_state.settings.get('gemini_key', ''))
+            st.markdown("<h4 style='margin-top:20px;'>🛠️ Developer Options</h4>", unsafe_allow_html=True)
+            demo_mode = st.toggle("Enable Demo Mode (Bypasses API Quota Limits)", value=st.session_state.settings.get('demo_mode', False))
+            stream_responses = st.toggle("Stream answers as they are generated", value=st.session_state.settings.get('stream_responses', True))
+            prefetch_prompts = st.toggle("Prefetch answers to personalized prompts", value=st.session_state.settings.get('prefetch_prompts', False))
+            st.caption("Your API key is required to use AI features.")
+            scheduler_stats = get_scheduler().stats()
+            st.caption(f"Gemini scheduler: {scheduler_stats['calls']} calls, {scheduler_stats['retries']} retries, {scheduler_stats['coalesced']} coalesced, {scheduler_stats['shed']} shed, {scheduler_stats['throttled_seconds']:.1f}s throttled")
+            cache_stats = get_response_cache().stats()
+            weather_stats = get_weather_service().stats()
+            avg_latency = f"{weather_stats['avg_latency'] * 1000:.0f} ms" if weather_stats['avg_latency'] is not None else "n/a"
+            st.caption(f"Weather forecasts: {weather_stats['locations']} locations, {weather_stats['fetches']} fetches ({weather_stats['failures']} failed), avg latency {avg_latency}, {weather_stats['stale_served']} served stale")
+            usage = st.session_state.token_usage
+            last_usage = f"last {usage['last'][0]} in / {usage['last'][1]} out" if usage['last'] else "none yet"
+            st.caption(f"Tokens this session: {usage['requests']} requests, {usage['prompt']} prompt / {usage['output']} output ({last_usage})")
+            st.caption(f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate ({cache_stats['memory_hits']} memory / {cache_stats['disk_hits']} disk hits, {cache_stats['misses']} misses), {cache_stats['memory_entries']} in memory, {cache_stats['disk_entries']} on disk")
+            st.markdown("</div>", unsafe_allow_html=True)
+
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button("💾 " + t('save'), use_container_width=True):
+            old_location = get_location_string(st.session_state.settings)
+            st.session_state.settings.update({
+                'country': sel_country, 'state': sel_state, 
+                'soil_type': sel_soil, 'water_condition': sel_water, 
+                'language': sel_lang, 'crop': sel_crop, 'sowing_date': sel_date,
+                'gemini_key': new_key, 'demo_mode': demo_mode, 'stream_responses': stream_responses,
+                'prefetch_prompts': prefetch_prompts
+            })
+            save_farmer_settings()
+            st.success("Settings Saved Successfully!")
+            new_location = get_location_string(st.session_state.settings)
+            if new_location != old_location:
+                get_weather_service().invalidate(new_location) # Other farmers' locations stay cached
+            prefetch_prompt_answers()
+            st.rerun()
+except BaseException as e:
+    # st.rerun()/st.stop() end the run by raising; those renders count too
+    page_span.finish(outcome={'RerunException': 'rerun', 'StopException': 'stop'}.get(type(e).__name__, 'error'))
+    raise
+finally:
+    page_span.finish()
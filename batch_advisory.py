@@ -0,0 +1,254 @@
+"""Answer a file of farmer questions without the Streamlit app.
+
+    python batch_advisory.py questions.csv --output answers.jsonl
+    python batch_advisory.py questions.jsonl --concurrency 8
+    python batch_advisory.py questions.csv --demo          # local stand-in, no API key
+    cat questions.jsonl | python batch_advisory.py - --format jsonl
+
+Each row (a CSV record with a header, or one JSON object per line) needs a
+`question`; `id`, `state`, `crop`, `soil_type` (or `soil`),
+`water_condition` (or `water`) and `language` are optional and fall back
+to the --state/--crop/--soil/--water/--language defaults. Prompts are
+built exactly as the chat builds them, and answers go through the same
+kind of rate-limited scheduler and the shared answer cache. The scheduler
+is this process's own: its rate limit (--rpm/--burst) is separate from the
+app's, even when both use the same API key, so leave room for the app.
+
+Input is read lazily with at most 2 x --concurrency rows in flight, so
+memory stays flat however large the file is. Every finished row is
+appended to --output at once as one JSON line with its latency. Rerunning
+the same command skips rows already answered there, so an interrupted run
+resumes where it stopped; rows that failed are retried, and the newest line
+for a row wins.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+import metrics
+from advisory import build_prompt, demo_answer, gemini_model, is_model_resolution_error, select_gemini_model
+from response_cache import ResponseCache, make_cache_key
+from scheduler import GeminiScheduler
+
+
+class BatchAdvisor:
+    """Answers one question for one farmer context; safe to call from many threads"""
+
+    def __init__(self, api_key=None, demo=False, demo_latency=0.0, scheduler=None, cache=None):
+        self.api_key = api_key
+        self.demo = demo
+        self.demo_latency = demo_latency
+        self.scheduler = scheduler
+        self.cache = cache
+        self._model = None
+        self._model_lock = threading.Lock()
+        if api_key and not demo:
+            genai.configure(api_key=api_key)
+
+    def answer(self, question, settings):
+        """(answer, source) where source is 'demo', 'cache' or 'gemini'"""
+        if self.demo:
+            time.sleep(self.demo_latency)
+            return demo_answer(question, settings), 'demo'
+
+        cache_key = make_cache_key(settings, question)
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached, 'cache'
+
+        full_prompt = build_prompt(question, settings)
+        for attempt in range(2):
+            model = self._resolve_model(refresh=attempt > 0)
+            if model is None:
+                raise RuntimeError("This API key does not have access to any models in this region.")
+            try:
+                with metrics.span("gemini.generate_content", cache="miss", caller="batch") as gen_span:
+                    # Duplicate questions within this run are sent once (the app's scheduler lives in another process)
+                    answer = self.scheduler.submit(self.api_key, lambda: model.generate_content(full_prompt).text, key=cache_key)
+                    gen_span.set(bytes_in=len(full_prompt.encode("utf-8")), bytes_out=len(answer.encode("utf-8")))
+            except Exception as e:
+                if attempt == 0 and is_model_resolution_error(e):
+                    continue  # Retired model: re-resolve once
+                raise
+            if self.cache:
+                self.cache.set(cache_key, answer)
+            return answer, 'gemini'
+
+    def _resolve_model(self, refresh=False):
+        with self._model_lock:
+            if self._model is None or refresh:
+                model_name = select_gemini_model(self.api_key)
+                self._model = gemini_model(self.api_key, model_name) if model_name else None
+            return self._model
+
+
+# --- INPUT / OUTPUT --------------------------------------------------------
+
+def detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(stream, fmt):
+    """Yields (row number, dict or None if unparseable), one line at a time"""
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            if None in row:  # More fields than the header
+                yield number, None
+                continue
+            yield number, {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        return
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def row_id(number, row):
+    return str((row or {}).get('id') or number)
+
+
+def row_settings(row, defaults):
+    return {
+        'state': row.get('state') or defaults['state'],
+        'crop': row.get('crop') or defaults['crop'],
+        'soil_type': row.get('soil_type') or row.get('soil') or defaults['soil_type'],
+        'water_condition': row.get('water_condition') or row.get('water') or defaults['water_condition'],
+        'language': row.get('language') or defaults['language'],
+    }
+
+
+def load_checkpoint(path):
+    """Ids of rows already answered in an earlier run's output"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if 'error' in record:
+                done.discard(record['id'])
+            else:
+                done.add(record['id'])
+    return done
+
+
+def ensure_line_boundary(path):
+    """An interrupted run may have left half a line; start the next record on a fresh one"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                with open(path, "ab") as out:
+                    out.write(b"\n")
+
+
+def process_row(advisor, number, row, defaults):
+    record = {'row': number, 'id': row_id(number, row)}
+    started = time.perf_counter()
+    try:
+        if row is None:
+            raise ValueError("row could not be parsed")
+        question = (row.get('question') or row.get('query') or '').strip()
+        if not question:
+            raise ValueError("row has no question")
+        settings = row_settings(row, defaults)
+        record.update(question=question, **settings)
+        record['answer'], record['source'] = advisor.answer(question, settings)
+    except Exception as e:
+        record['error'] = str(e)
+    record['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+
+# --- CLI -------------------------------------------------------------------
+
+def main():
+    load_dotenv()
+    metrics.configure_from_env()
+
+    parser = argparse.ArgumentParser(description="Answer a CSV/JSONL file of farmer questions with AgroNova's prompts.")
+    parser.add_argument("input", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("--output", default="answers.jsonl", help="JSONL results; also the resume checkpoint")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the input file extension")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--api-key", default=os.getenv('GOOGLE_API_KEY'))
+    parser.add_argument("--rpm", type=int, default=int(os.getenv('AGRONOVA_GEMINI_RPM', 15)))
+    parser.add_argument("--burst", type=int, default=int(os.getenv('AGRONOVA_GEMINI_BURST', 5)))
+    parser.add_argument("--no-cache", action="store_true", help="don't read or fill the shared answer cache")
+    parser.add_argument("--demo", action="store_true", help="answer with the demo-mode stand-in (no API calls)")
+    parser.add_argument("--demo-latency-ms", type=float, default=0, help="simulated latency per demo answer")
+    parser.add_argument("--state", default="Maharashtra")
+    parser.add_argument("--crop", default="Wheat")
+    parser.add_argument("--soil", default="Red Soil")
+    parser.add_argument("--water", default="Good")
+    parser.add_argument("--language", default="English")
+    args = parser.parse_args()
+    if not args.demo and not args.api_key:
+        parser.error("no API key: pass --api-key, set GOOGLE_API_KEY, or use --demo")
+
+    cache = None
+    if not args.demo and not args.no_cache:
+        cache = ResponseCache(
+            os.path.join(os.getenv('AGRONOVA_DATA_DIR', '.agronova'), 'responses.sqlite3'),
+            ttl=int(os.getenv('AGRONOVA_RESPONSE_TTL', 86400)),
+            max_memory_entries=int(os.getenv('AGRONOVA_RESPONSE_CACHE_MEMORY', 512)),
+            max_disk_entries=int(os.getenv('AGRONOVA_RESPONSE_CACHE_DISK', 20000)),
+        )
+    # A batch waits out the rate limit instead of shedding rows
+    scheduler = GeminiScheduler(requests_per_minute=args.rpm, burst=args.burst, max_wait=3600)
+    advisor = BatchAdvisor(args.api_key, args.demo, args.demo_latency_ms / 1000, scheduler, cache)
+    defaults = {'state': args.state, 'crop': args.crop, 'soil_type': args.soil, 'water_condition': args.water, 'language': args.language}
+
+    done = load_checkpoint(args.output)
+    ensure_line_boundary(args.output)
+    counts = {'answered': 0, 'failed': 0, 'skipped': 0}
+    started = time.perf_counter()
+
+    def write(futures, out):
+        for future in futures:
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counts['failed' if 'error' in record else 'answered'] += 1
+        out.flush()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig", newline="")
+    try:
+        with source, open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(args.concurrency) as pool:
+            pending = set()
+            for number, row in read_rows(source, args.format or detect_format(args.input)):
+                if row_id(number, row) in done:
+                    counts['skipped'] += 1
+                    continue
+                if len(pending) >= 2 * args.concurrency:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    write(finished, out)
+                pending.add(pool.submit(process_row, advisor, number, row, defaults))
+            write(pending, out)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; rerun the same command to resume from {args.output}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"{counts['answered']} answered, {counts['failed']} failed, {counts['skipped']} already done "
+          f"in {elapsed:.1f}s -> {args.output}", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""Offline rerun-latency benchmarks for app.py.
+
+Drives the app headlessly with streamlit.testing's AppTest. Gemini, wttr.in
+and countriesnow.space are replaced by local stand-ins with configurable
+latency, so results are reproducible without network access or an API key.
+
+    python benchmarks/bench_pages.py                          # all scenarios
+    python benchmarks/bench_pages.py --scenario chat_500 --iterations 50
+    python benchmarks/bench_pages.py --gemini-ms 800 --output bench_results.json
+
+Each scenario reports p50/p95/p99 wall time over the timed iterations, plus
+net allocated and peak traced memory from one extra tracemalloc pass. The
+JSON written to --output is meant to be diffed between commits.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+sys.path.insert(0, ROOT)
+
+# Configure the app before it is first executed: private data dir, no rate limiting
+os.environ['AGRONOVA_DATA_DIR'] = tempfile.mkdtemp(prefix="agronova-bench-")
+os.environ.setdefault('AGRONOVA_GEMINI_RPM', '1000000')
+os.environ.setdefault('AGRONOVA_GEMINI_BURST', '1000000')
+
+import google.generativeai as genai  # noqa: E402
+import requests  # noqa: E402
+import streamlit as st  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from chat_history import ChatHistory  # noqa: E402
+from farmer_store import FarmerStore  # noqa: E402
+from image_ingest import ingest_image  # noqa: E402
+
+WTTR_PAYLOAD = {
+    'current_condition': [{'temp_C': '31', 'humidity': '60', 'weatherDesc': [{'value': 'Partly cloudy'}]}],
+    'weather': [
+        {'date': str(datetime.date.today() + datetime.timedelta(days=day)),
+         'hourly': [{'time': str(hour * 300), 'tempC': str(24 + 3 * min(hour, 8 - hour)), 'precipMM': '0.4',
+                     'weatherDesc': [{'value': 'Partly cloudy'}]} for hour in range(8)]}
+        for day in range(3)
+    ],
+}
+COUNTRIESNOW_PAYLOAD = {'data': [{'name': 'India', 'states': [{'name': 'Maharashtra'}, {'name': 'Punjab'}]}]}
+ANSWER = ("Apply a balanced NPK fertilizer at sowing, then top-dress with nitrogen at tillering. "
+          "Test the soil first and adjust for organic matter. ") * 4
+
+
+# --- LOCAL STAND-INS -------------------------------------------------------
+
+def install_stubs(gemini_ms, weather_ms, catalog_ms):
+    """Replace every external call the app makes with a delayed local response"""
+    def list_models(**kwargs):
+        time.sleep(gemini_ms / 1000)
+        return [SimpleNamespace(name="models/gemini-1.5-flash", supported_generation_methods=["generateContent"])]
+
+    class StubModel:
+        def __init__(self, name, **kwargs):
+            self.model_name = name
+
+        def generate_content(self, contents, stream=False, **kwargs):
+            time.sleep(gemini_ms / 1000)
+            words = [w + " " for w in ANSWER.split()]
+            if stream:
+                return (SimpleNamespace(text="".join(words[i:i + 8])) for i in range(0, len(words), 8))
+            return SimpleNamespace(text="".join(words))
+
+    genai.configure = lambda **kwargs: None
+    genai.list_models = list_models
+    genai.GenerativeModel = StubModel
+
+    real_request = requests.Session.request
+
+    def request(self, method, url, *args, **kwargs):
+        if "wttr.in" in url:
+            time.sleep(weather_ms / 1000)
+            return _json_response(WTTR_PAYLOAD)
+        if "countriesnow.space" in url:
+            time.sleep(catalog_ms / 1000)
+            return _json_response(COUNTRIESNOW_PAYLOAD)
+        return real_request(self, method, url, *args, **kwargs)
+
+    requests.Session.request = request
+
+
+def _json_response(payload):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(payload).encode("utf-8")
+    return response
+
+
+# --- SCENARIOS -------------------------------------------------------------
+# Each scenario is a generator: it does its setup, then yields a callable per
+# timed step. Only the yielded callables are measured.
+
+def new_app():
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.session_state['settings']['gemini_key'] = "bench-key"
+    return at
+
+
+def click(at, label):
+    next(b for b in at.button if b.label == label).click().run()
+
+
+def scenario_cold_start(iterations):
+    for _ in range(iterations):
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        yield at.run
+
+
+def scenario_navigation(iterations):
+    at = new_app()
+    for _ in range(iterations):
+        for label in ("Profile", "Setting", "Home"):
+            yield lambda label=label: click(at, label)
+
+
+def make_chat_scenario(turns):
+    def scenario(iterations):
+        at = new_app()
+        at.session_state['searching'] = True
+        store = FarmerStore(os.path.join(os.environ['AGRONOVA_DATA_DIR'], 'bench-chat.sqlite3'))
+        for i in range(iterations):
+            # A fresh N-turn history per step, so every sample sees the same length
+            farmer_id = f"bench{turns}x{i}x{time.monotonic_ns()}"
+            for turn in range(turns):
+                store.append_turn(farmer_id, f"Question {turn} about fertilizer for wheat?", ANSWER)
+            store.flush()
+            history = ChatHistory(store, farmer_id)
+            at.session_state['chat_history'] = history
+            at.run()
+            yield lambda i=i: at.chat_input(key="chat_followup").set_value(f"Follow-up {turns}-{i}?").run()
+    return scenario
+
+
+def scenario_image_upload(iterations):
+    photo = Image.new("RGB", (4000, 3000), (40, 110, 50))
+    ImageDraw.Draw(photo).ellipse((900, 600, 3100, 2400), fill=(90, 190, 70))
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=92)
+    data = buffer.getvalue()
+
+    at = new_app()
+    at.session_state['searching'] = True
+    at.run()
+    for i in range(iterations):
+        def step(i=i):
+            image = ingest_image(io.BytesIO(data))
+            at.session_state['pending_query'] = [f"What is wrong with this leaf? ({i})", image, False]
+            at.run()
+        yield step
+
+
+def scenario_save_settings(iterations):
+    at = new_app()
+    click(at, "Setting")
+    for i in range(iterations):
+        at.selectbox[0].set_value("India")
+        yield lambda: click(at, "💾 Save Settings")
+
+
+SCENARIOS = {
+    'cold_start': scenario_cold_start,
+    'navigation': scenario_navigation,
+    'chat_1': make_chat_scenario(1),
+    'chat_50': make_chat_scenario(50),
+    'chat_500': make_chat_scenario(500),
+    'image_upload': scenario_image_upload,
+    'save_settings': scenario_save_settings,
+}
+
+
+# --- MEASUREMENT -----------------------------------------------------------
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def run_scenario(name, iterations, warmup):
+    steps = SCENARIOS[name](warmup + iterations)
+    for _ in range(warmup):
+        next(steps)()
+
+    wall = []
+    for step in steps:
+        started = time.perf_counter()
+        step()
+        wall.append(time.perf_counter() - started)
+
+    # One extra traced pass: tracemalloc slows everything down, so it never overlaps the timings
+    traced = SCENARIOS[name](warmup + 1)
+    for _ in range(warmup):
+        next(traced)()
+    step = next(traced)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    step()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': len(wall),
+        'p50_ms': percentile(wall, 50) * 1000,
+        'p95_ms': percentile(wall, 95) * 1000,
+        'p99_ms': percentile(wall, 99) * 1000,
+        'mean_ms': sum(wall) / len(wall) * 1000,
+        'net_alloc_kib': (current - baseline) / 1024,
+        'peak_traced_kib': (peak - baseline) / 1024,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AgroNova page reruns with local stand-ins.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default: all")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--gemini-ms", type=float, default=50, help="stand-in Gemini latency per call")
+    parser.add_argument("--weather-ms", type=float, default=30, help="stand-in wttr.in latency per request")
+    parser.add_argument("--catalog-ms", type=float, default=30, help="stand-in countriesnow latency per request")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    install_stubs(args.gemini_ms, args.weather_ms, args.catalog_ms)
+    results = {}
+    print(f"{'scenario':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc KiB':>12}{'peak KiB':>12}")
+    for name in args.scenario or SCENARIOS:
+        result = results[name] = run_scenario(name, args.iterations, args.warmup)
+        print(f"{name:<16}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['net_alloc_kib']:>12.0f}{result['peak_traced_kib']:>12.0f}")
+
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'streamlit': st.__version__,
+        'config': vars(args),
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'scenarios': results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
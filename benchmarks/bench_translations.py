@@ -0,0 +1,42 @@
+"""Micro-benchmark: per-rerun cost of t() before and after the locale catalogs.
+
+    python benchmarks/bench_translations.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translations import LANGUAGE_CODES, get_catalog, translate  # noqa: E402
+
+# Every t() key looked up during one Home -> chat -> Settings pass
+RERUN_KEYS = ['home', 'profile', 'setting', 'search_placeholder', 'personalized_prompts',
+              'history', 'news', 'weather', 'harvest', 'tips', 'setting', 'save']
+
+
+def legacy_t(key, lang):
+    # The old t(): rebuilds the translations literal on every call
+    translations = {
+        'English': {'home': 'Home', 'profile': 'Profile', 'setting': 'Setting', 'search_placeholder': 'Ask anything about farming...', 'personalized_prompts': 'Personalized Prompts', 'weather': 'Weather', 'tips': 'Harvesting Tips', 'harvest': 'Harvest Countdown', 'seeds': 'Recommended Seeds', 'save': 'Save Settings', 'history': 'History', 'news': 'Local Ag News'},
+    }
+    return translations.get(lang, translations['English']).get(key, key)
+
+
+def rerun(t, lang):
+    for key in RERUN_KEYS:
+        t(key, lang)
+
+
+def main(number=20000):
+    for lang in LANGUAGE_CODES:
+        get_catalog(lang)  # Measure steady state, not the one-off file read
+    print(f"{'language':<12}{'before (us/rerun)':>20}{'after (us/rerun)':>20}{'speedup':>10}")
+    for lang in ("English", "Hindi", "Mandarin"):
+        before = min(timeit.repeat(lambda: rerun(legacy_t, lang), number=number, repeat=5)) / number * 1e6
+        after = min(timeit.repeat(lambda: rerun(translate, lang), number=number, repeat=5)) / number * 1e6
+        print(f"{lang:<12}{before:>20.2f}{after:>20.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
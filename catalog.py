@@ -0,0 +1,129 @@
+"""Bundled country -> states catalog for the Settings page.
+
+The catalog ships with the app in data/countries.json, so Settings never
+waits on the network. Refresh it offline with:
+
+    python catalog.py                 # from countriesnow.space
+    python catalog.py --source iso    # from ISO 3166-2 (needs `pip install pycountry`)
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import metrics
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'countries.json')
+COUNTRIESNOW_URL = "https://countriesnow.space/api/v0.1/countries/states"
+FALLBACK_COUNTRIES = {"India": ["Maharashtra", "Punjab", "Gujarat"], "United States": ["California", "Texas"]}
+
+
+class CountryCatalog:
+    """Lazily loaded catalog with O(1) country->states and state->country lookups"""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._states = None
+
+    @property
+    def countries(self):
+        self._ensure_loaded()
+        return self._country_list
+
+    def states(self, country):
+        self._ensure_loaded()
+        return self._states.get(country, [])
+
+    def country_index(self, country, default=0):
+        self._ensure_loaded()
+        return self._country_pos.get(country, default)
+
+    def state_index(self, country, state, default=0):
+        self._ensure_loaded()
+        return self._state_pos.get((country, state), default)
+
+    def country_of(self, state):
+        """First country that has a state/region with this name, or None"""
+        self._ensure_loaded()
+        return self._state_country.get(state)
+
+    def _ensure_loaded(self):
+        if self._states is not None:
+            return
+        with self._lock:
+            if self._states is not None:
+                return
+            with metrics.span("catalog.load") as load_span:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        states = json.load(f)['countries']
+                    load_span.set(bytes_in=os.path.getsize(self.path))
+                except (OSError, ValueError, KeyError):
+                    states = FALLBACK_COUNTRIES
+                    load_span.set(outcome="fallback")
+            self._country_list = list(states)
+            self._country_pos = {country: i for i, country in enumerate(self._country_list)}
+            self._state_pos = {}
+            self._state_country = {}
+            for country, names in states.items():
+                for i, state in enumerate(names):
+                    self._state_pos[(country, state)] = i
+                    self._state_country.setdefault(state, country)
+            self._states = states
+
+
+def fetch_countriesnow(timeout=30):
+    import requests
+
+    response = requests.get(COUNTRIESNOW_URL, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()['data']
+    return {item['name']: [state['name'] for state in item['states']] for item in data if item['states']}
+
+
+def _plain(name):
+    name = re.sub(r"\s*\[.*\]$", "", name)  # e.g. "Wales [Cymru GB-CYM]"
+    return "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+
+
+def fetch_iso():
+    import pycountry
+
+    countries = {}
+    for country in pycountry.countries:
+        subdivisions = pycountry.subdivisions.get(country_code=country.alpha_2) or []
+        states = sorted({_plain(s.name) for s in subdivisions if s.parent_code is None})
+        if states:
+            countries[_plain(getattr(country, 'common_name', country.name))] = states
+    return dict(sorted(countries.items()))
+
+
+def write_catalog(countries, source, path=CATALOG_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = {'source': source, 'generated': datetime.date.today().isoformat(), 'countries': countries}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the bundled country/state catalog.")
+    parser.add_argument("--source", choices=["countriesnow", "iso"], default="countriesnow")
+    parser.add_argument("--out", default=CATALOG_PATH)
+    args = parser.parse_args()
+
+    if args.source == "iso":
+        countries, source = fetch_iso(), "ISO 3166-2 (pycountry)"
+    else:
+        countries, source = fetch_countriesnow(), COUNTRIESNOW_URL
+    write_catalog(countries, source, args.out)
+    print(f"Wrote {len(countries)} countries, {sum(map(len, countries.values()))} states to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import threading
+from collections import deque
+
+PREVIEW_CHARS = 35
+
+
+class ChatHistory:
+    """A farmer's question/answer turns, persisted in a FarmerStore.
+
+    Indices are store `seq` numbers, which every tab of the farmer shares:
+    each read re-checks the stored count, so turns another tab committed
+    show up here too. The newest `window` stored turns stay in memory; older
+    ones are read back a page at a time (a range scan on the (farmer_id, seq)
+    key), so neither rendering nor reopening a long history loads it whole.
+    Turns appended here sit in a pending buffer, after the stored ones, until
+    the store's writer commits them, so a read never waits on the write queue.
+
+    `summary` is a rolling summary of the oldest `summary_covers` turns; it
+    only ever grows forward, one fold of newly aged-out turns at a time.
+    """
+
+    def __init__(self, store, farmer_id, window=50):
+        self.store = store
+        self.farmer_id = farmer_id
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = deque()  # Turns appended here and still queued for the writer, oldest first
+        self._written = 0  # Bumped whenever the writer settles a pending turn
+        self._stored = store.count_turns(farmer_id)
+        self._recent = deque(store.page_turns(farmer_id, max(0, self._stored - window), self._stored), maxlen=window)
+        self.summary, self.summary_covers = store.load_summary(farmer_id)
+
+    def __len__(self):
+        stored, pending, _ = self._snapshot()
+        return stored + len(pending)
+
+    def append(self, question, answer):
+        with self._lock:
+            self._pending.append((question, answer))
+        self.store.append_turn(self.farmer_id, question, answer, on_written=self._settled)
+
+    def _settled(self, committed):
+        # Writer thread: the oldest pending turn was committed, or dropped for good (the queue is FIFO)
+        with self._lock:
+            self._pending.popleft()
+            self._written += 1
+
+    def _snapshot(self):
+        """(stored count, pending turns, (first index, turns) of the in-memory window), consistent with each other"""
+        while True:
+            with self._lock:
+                written, pending = self._written, list(self._pending)
+            stored = self.store.count_turns(self.farmer_id)
+            with self._lock:
+                if written != self._written:
+                    continue  # A pending turn landed while counting: it would show up twice
+                if stored > self._stored:
+                    # This tab's commits or another tab's: only the newest `window` are worth fetching
+                    since = max(self._stored, stored - self.window)
+                    self._recent.extend(self.store.page_turns(self.farmer_id, since, stored))
+                    self._stored = stored
+                return stored, pending, (self._stored - len(self._recent), list(self._recent))
+
+    def tail(self, count):
+        """The newest `count` turns, oldest first"""
+        total = len(self)
+        return self.page(max(0, total - count), total)
+
+    def page(self, start, stop):
+        """Turns [start, stop) in chronological order"""
+        stored, pending, (cached, recent) = self._snapshot()
+        turns = []
+        if start < cached:
+            turns = self.store.page_turns(self.farmer_id, start, min(stop, cached))
+        turns.extend(recent[max(0, start - cached):max(0, stop - cached)])
+        turns.extend(pending[max(0, start - stored):max(0, stop - stored)])
+        return turns
+
+    def previews(self, count):
+        """Question previews of the newest `count` turns, newest first"""
+        stored, pending, (cached, recent) = self._snapshot()
+        previews = [question[:PREVIEW_CHARS] for question, _ in reversed(pending + recent)][:count]
+        if len(previews) < count and cached:
+            older = self.store.page_previews(self.farmer_id, max(0, cached - (count - len(previews))), cached, PREVIEW_CHARS)
+            previews.extend(reversed(older))
+        return previews
+
+    def set_summary(self, summary, covers):
+        """Adopt a summary of the first `covers` turns, unless a newer one already landed"""
+        with self._lock:
+            if covers <= self.summary_covers:
+                return
+            self.summary, self.summary_covers = summary, covers
+        self.store.save_summary(self.farmer_id, summary, covers)
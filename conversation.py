@@ -0,0 +1,69 @@
+"""Token-budgeted context for follow-up questions.
+
+A follow-up carries the farmer's settings, a rolling summary of older turns,
+and as many of the newest unsummarized turns as fit in the token budget
+(at most `max_turns`), verbatim. Turns that age out of the verbatim window
+are folded into the summary a few at a time, so the summary is extended,
+never rebuilt from the whole history.
+"""
+from typing import NamedTuple
+
+from advisory import settings_context
+
+
+def estimate_tokens(text):
+    """Cheap upper-leaning estimate (~4 UTF-8 bytes per token), no tokenizer round trip"""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+class FollowupPrompt(NamedTuple):
+    prompt: str
+    turns: int  # Turns included verbatim
+    estimated_tokens: int
+
+
+def select_turns(turns, budget, max_turns):
+    """The newest of `turns` (oldest first) that fit in `budget` tokens, whole turns only"""
+    chosen, used = [], 0
+    for question, answer in reversed(turns[-max_turns:] if max_turns else []):
+        cost = estimate_tokens(question) + estimate_tokens(answer) + 4
+        if used + cost > budget:
+            break
+        chosen.append((question, answer))
+        used += cost
+    chosen.reverse()
+    return chosen
+
+
+def build_followup_prompt(question, settings, summary, turns, budget, max_turns):
+    """Prompt for `question` given the rolling summary and the unsummarized turns after it"""
+    parts = [settings_context(settings)]
+    if summary:
+        parts.append(f"Summary of the earlier conversation: {summary}")
+    recent = select_turns(turns, budget - estimate_tokens(summary), max_turns)
+    if recent:
+        parts.append("Recent conversation:\n" + "\n".join(f"Farmer: {q}\nAdvisor: {a}" for q, a in recent))
+    parts.append(f"Question: {question}")
+    prompt = "\n".join(parts)
+    return FollowupPrompt(prompt, len(recent), estimate_tokens(prompt))
+
+
+def summary_prompt(summary, turns, max_tokens):
+    """Ask the model to extend `summary` with `turns`, rather than re-summarize everything"""
+    exchanges = "\n".join(f"Farmer: {q}\nAdvisor: {a}" for q, a in turns)
+    return (f"You keep a running summary of a conversation between a farmer and an agricultural advisor.\n"
+            f"Current summary: {summary or '(empty)'}\n"
+            f"New exchanges:\n{exchanges}\n"
+            f"Rewrite the summary to include the new exchanges in at most {max_tokens * 3 // 4} words. "
+            f"Keep facts about the farm, the problems raised and the advice given. Reply with the summary only.")
+
+
+def extend_summary(summary, turns, max_tokens):
+    """Model-free fallback: one line per turn, oldest lines dropped to stay within `max_tokens`"""
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        gist = answer.strip().split("\n")[0][:160]
+        lines.append(f"- Asked: {question.strip()[:120]} / Advised: {gist}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
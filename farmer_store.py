@@ -0,0 +1,190 @@
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS farmers (
+    farmer_id TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_turns (
+    farmer_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (farmer_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    farmer_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    covers INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plots (
+    farmer_id TEXT PRIMARY KEY,
+    columns TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class FarmerStore:
+    """Per-farmer settings, plots and chat history in one SQLite database (WAL mode).
+
+    Reads use a connection per thread, so sessions never queue behind each
+    other; WAL lets them run while the writer commits. All writes go through
+    a single background thread that groups whatever is queued (up to
+    `batch_size` statements, or `flush_interval` seconds) into one
+    transaction, so the request path never waits on disk.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=0.25):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self.failed_writes = 0  # Statements dropped after failing on their own
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._connect()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.close()
+        threading.Thread(target=self._write_loop, name="farmer-store-writer", daemon=True).start()
+
+    # --- reads (caller's thread) ---
+
+    def load_settings(self, farmer_id):
+        row = self._db().execute("SELECT settings FROM farmers WHERE farmer_id = ?", (farmer_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_plots(self, farmer_id):
+        """The farmer's plot table as a dict of column lists, or None"""
+        row = self._db().execute("SELECT columns FROM plots WHERE farmer_id = ?", (farmer_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_summary(self, farmer_id):
+        """(rolling summary, number of oldest turns it covers); ("", 0) if none yet"""
+        row = self._db().execute("SELECT summary, covers FROM summaries WHERE farmer_id = ?", (farmer_id,)).fetchone()
+        return tuple(row) if row else ("", 0)
+
+    def count_turns(self, farmer_id):
+        row = self._db().execute("SELECT MAX(seq) FROM chat_turns WHERE farmer_id = ?", (farmer_id,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def page_turns(self, farmer_id, start, stop):
+        """Turns with start <= seq < stop, oldest first (a primary-key range scan)"""
+        rows = self._db().execute(
+            "SELECT question, answer FROM chat_turns WHERE farmer_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (farmer_id, start, stop),
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def page_previews(self, farmer_id, start, stop, chars):
+        rows = self._db().execute(
+            "SELECT substr(question, 1, ?) FROM chat_turns WHERE farmer_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (chars, farmer_id, start, stop),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    # --- writes (queued for the writer thread) ---
+
+    def save_settings(self, farmer_id, settings):
+        self._queue.put((
+            "INSERT INTO farmers (farmer_id, settings, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(farmer_id) DO UPDATE SET settings = excluded.settings, updated_at = excluded.updated_at",
+            (farmer_id, json.dumps(settings), time.time()),
+            None,
+        ))
+
+    def save_plots(self, farmer_id, columns):
+        if columns is None:
+            self._queue.put(("DELETE FROM plots WHERE farmer_id = ?", (farmer_id,), None))
+            return
+        self._queue.put((
+            "INSERT INTO plots (farmer_id, columns, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(farmer_id) DO UPDATE SET columns = excluded.columns, updated_at = excluded.updated_at",
+            (farmer_id, json.dumps(columns), time.time()),
+            None,
+        ))
+
+    def save_summary(self, farmer_id, summary, covers):
+        self._queue.put((
+            "INSERT INTO summaries (farmer_id, summary, covers, updated_at) VALUES (?1, ?2, ?3, ?4) "
+            "ON CONFLICT(farmer_id) DO UPDATE SET summary = ?2, covers = ?3, updated_at = ?4 WHERE covers < ?3",
+            (farmer_id, summary, covers, time.time()),
+            None,
+        ))
+
+    def append_turn(self, farmer_id, question, answer, on_written=None):
+        """Queue a turn; `on_written(committed)` runs on the writer thread once it is committed or dropped"""
+        # seq is assigned at commit time, so two tabs of one farmer never collide
+        self._queue.put((
+            "INSERT INTO chat_turns (farmer_id, seq, question, answer, created_at) "
+            "SELECT ?1, COALESCE(MAX(seq) + 1, 0), ?2, ?3, ?4 FROM chat_turns WHERE farmer_id = ?1",
+            (farmer_id, question, answer, time.time()),
+            on_written,
+        ))
+
+    def flush(self):
+        """Block until everything queued so far is committed (setup and tests; never from a session)"""
+        self._queue.join()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=30000")
+        return db
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            dropped = set()
+            try:
+                with db:
+                    for sql, params, _ in batch:
+                        db.execute(sql, params)
+            except sqlite3.Error:
+                dropped = self._write_one_by_one(db, batch)
+            finally:
+                for i, (_, _, on_written) in enumerate(batch):
+                    if on_written is not None:
+                        on_written(i not in dropped)
+                    self._queue.task_done()
+
+    def _write_one_by_one(self, db, batch):
+        """Indices of the statements that still fail on their own"""
+        # One bad statement must not take other farmers' writes down with it
+        dropped = set()
+        for i, (sql, params, _) in enumerate(batch):
+            try:
+                with db:
+                    db.execute(sql, params)
+            except sqlite3.Error as exc:
+                dropped.add(i)
+                self.failed_writes += 1
+                metrics.span("store.write", outcome="error").finish()
+                print(f"farmer-store: dropped write ({exc}): {sql.split(None, 3)[:3]}", file=sys.stderr)
+        return dropped
@@ -0,0 +1,75 @@
+import io
+import threading
+from collections import deque
+from typing import NamedTuple
+
+from PIL import Image, ImageOps
+
+import metrics
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+class IngestedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+    phash: str
+    size: tuple
+
+    def as_part(self):
+        """Inline blob accepted by model.generate_content"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+
+def dhash(img, hash_size=8):
+    """64-bit difference hash: survives re-encoding, resizing and small lighting changes"""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+def ingest_image(file, max_edge=1024, fmt='JPEG', quality=80):
+    """Decode an upload at reduced size and re-encode it to compact bytes.
+
+    JPEGs are decoded in draft mode, so the full-resolution bitmap of a phone
+    photo is never materialised; other formats are thumbnailed after decode.
+    """
+    with metrics.span("image.ingest", format=fmt) as ingest_span:
+        with Image.open(file) as img:
+            ingest_span.set(source_pixels=img.width * img.height)
+            img.draft('RGB', (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img).convert('RGB')
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, quality=quality, optimize=True)
+        ingest_span.set(bytes_in=getattr(file, 'size', 0) or 0, bytes_out=buffer.tell())
+    return IngestedImage(buffer.getvalue(), MIME_TYPES[fmt], dhash(img), img.size)
+
+
+class PhashIndex:
+    """Maps a perceptual hash onto a recently seen near-identical one.
+
+    Two photos of the same leaf rarely hash identically, so lookups match any
+    hash within `max_distance` differing bits and reuse the earlier hash as the
+    cache key for the diagnosis.
+    """
+
+    def __init__(self, max_distance=4, capacity=4096):
+        self.max_distance = max_distance
+        self._hashes = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def canonical(self, phash):
+        value = int(phash, 16)
+        with self._lock:
+            for seen in self._hashes:
+                if bin(seen ^ value).count("1") <= self.max_distance:  # int.bit_count() needs 3.10
+                    return f"{seen:016x}"
+            self._hashes.append(value)
+        return phash
@@ -0,0 +1,193 @@
+"""Timing spans for external calls and page renders, aggregated per process.
+
+Off unless AGRONOVA_METRICS names one or more sinks (comma separated):
+
+    prometheus   text exposition on http://0.0.0.0:$AGRONOVA_METRICS_PORT/metrics (default 9464)
+    jsonl        one line per span in $AGRONOVA_METRICS_FILE, rotated at
+                 $AGRONOVA_METRICS_MAX_BYTES (default 10 MB, 3 backups kept)
+
+Call `configure_from_env()` once the environment is loaded. When disabled,
+`span()` hands back a shared no-op object, so instrumented code pays one
+function call and nothing else.
+
+String attributes become histogram labels (keep them low-cardinality:
+outcome, cache, page); numeric attributes such as bytes_in/bytes_out are
+summed into per-span counters.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def finish(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('registry', 'name', 'attrs', 'started', 'done')
+
+    def __init__(self, registry, name, attrs):
+        self.registry = registry
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and 'outcome' not in self.attrs:
+            self.attrs['outcome'] = 'error'
+        self.finish()
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+        if self.done:
+            return
+        self.done = True
+        self.attrs.update(attrs)
+        self.attrs.setdefault('outcome', 'ok')
+        self.registry.record(self.name, time.perf_counter() - self.started, self.attrs)
+
+
+class Registry:
+    """Per-process histograms of span durations plus summed numeric attributes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._counters = {}  # (name, attr) -> total
+        self._sinks = []
+
+    def record(self, name, seconds, attrs):
+        labels = tuple(sorted((k, v) for k, v in attrs.items() if isinstance(v, str)))
+        with self._lock:
+            hist = self._histograms.get((name, labels))
+            if hist is None:
+                hist = self._histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[len(BUCKETS)] += 1
+            hist[-1] += seconds
+            for key, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._counters[(name, key)] = self._counters.get((name, key), 0) + value
+        for sink in self._sinks:
+            sink(name, seconds, attrs)
+
+    def prometheus_text(self):
+        lines = ["# HELP agronova_span_duration_seconds Wall time of instrumented calls and renders.",
+                 "# TYPE agronova_span_duration_seconds histogram"]
+        with self._lock:
+            for (name, labels), hist in sorted(self._histograms.items()):
+                base = ",".join([f'span="{name}"'] + [f'{k}="{v}"' for k, v in labels])
+                for i, bound in enumerate(BUCKETS):
+                    lines.append(f'agronova_span_duration_seconds_bucket{{{base},le="{bound}"}} {hist[i]}')
+                lines.append(f'agronova_span_duration_seconds_bucket{{{base},le="+Inf"}} {hist[len(BUCKETS)]}')
+                lines.append(f'agronova_span_duration_seconds_sum{{{base}}} {hist[-1]}')
+                lines.append(f'agronova_span_duration_seconds_count{{{base}}} {hist[len(BUCKETS)]}')
+            lines += ["# HELP agronova_span_attribute_total Sum of numeric span attributes (payload sizes, counts).",
+                      "# TYPE agronova_span_attribute_total counter"]
+            for (name, key), total in sorted(self._counters.items()):
+                lines.append(f'agronova_span_attribute_total{{span="{name}",attribute="{key}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonlSink:
+    """Appends one JSON line per span, rotating file -> file.1 -> ... -> file.N"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def __call__(self, name, seconds, attrs):
+        line = json.dumps({'ts': time.time(), 'span': name, 'seconds': round(seconds, 6), **attrs}, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+            except OSError:
+                pass
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+def serve_prometheus(registry, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200 if self.path.startswith("/metrics") else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+REGISTRY = Registry()
+_enabled = False
+_configured = False
+
+
+def configure_from_env():
+    """Read the AGRONOVA_METRICS* settings once per process; later calls are no-ops"""
+    global _enabled, _configured
+    if _configured:
+        return
+    _configured = True
+    sinks = {s.strip() for s in os.getenv('AGRONOVA_METRICS', '').split(",") if s.strip()}
+    port = int(os.getenv('AGRONOVA_METRICS_PORT', 9464))
+    path = os.getenv('AGRONOVA_METRICS_FILE', os.path.join(os.getenv('AGRONOVA_DATA_DIR', '.agronova'), 'metrics.jsonl'))
+    max_bytes = int(os.getenv('AGRONOVA_METRICS_MAX_BYTES', 10 * 1024 * 1024))
+    if 'jsonl' in sinks:
+        REGISTRY._sinks.append(JsonlSink(path, max_bytes))
+    if 'prometheus' in sinks:
+        try:
+            serve_prometheus(REGISTRY, port)
+        except OSError:
+            pass  # Another process on this node already serves the port
+    _enabled = bool(sinks)
+
+
+def span(name, **attrs):
+    """`with span("gemini.generate_content", cache="miss") as s: ...; s.set(bytes_out=...)`"""
+    if not _enabled:
+        return _NOOP
+    return Span(REGISTRY, name, attrs)
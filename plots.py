@@ -0,0 +1,115 @@
+import csv
+import datetime
+import io
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_DURATION = 120  # Days, for crops missing from the duration table
+COLUMNS = ('name', 'crop', 'sowing_date', 'area', 'soil')
+
+
+class HarvestStatus(NamedTuple):
+    """Per-plot countdown arrays, computed for every plot in one pass"""
+    days_passed: np.ndarray
+    days_remaining: np.ndarray
+    progress: np.ndarray
+    ready: np.ndarray
+    harvest_date: np.ndarray
+
+
+class PlotTable:
+    """A farm's plots stored column-wise: one NumPy array per field.
+
+    A single-crop farm is simply a one-row table, so the Profile card and the
+    cooperative view share the same countdown code.
+    """
+
+    def __init__(self, name, crop, sowing_date, area, soil):
+        self.name = np.asarray(name, dtype=object)
+        self.crop = np.asarray(crop, dtype=object)
+        self.sowing_date = np.asarray(sowing_date, dtype='datetime64[D]')
+        self.area = np.asarray(area, dtype=np.float64)
+        self.soil = np.asarray(soil, dtype=object)
+
+    def __len__(self):
+        return len(self.crop)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """The one-plot farm described by the Settings page"""
+        return cls(["Main plot"], [settings.get('crop', 'Wheat')], [settings['sowing_date']],
+                   [np.nan], [settings.get('soil_type', 'Red Soil')])
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(*(columns[key] for key in COLUMNS))
+
+    def to_columns(self):
+        """JSON-ready dict of lists (dates as ISO strings, missing areas as None)"""
+        return {
+            'name': self.name.tolist(), 'crop': self.crop.tolist(),
+            'sowing_date': np.datetime_as_string(self.sowing_date).tolist(),
+            'area': [None if np.isnan(a) else a for a in self.area.tolist()],
+            'soil': self.soil.tolist(),
+        }
+
+    @classmethod
+    def from_csv(cls, text, default_soil='Red Soil'):
+        """Parse `name,crop,sowing_date,area,soil` rows; only crop and sowing_date are required"""
+        columns = {key: [] for key in COLUMNS}
+        for i, row in enumerate(csv.DictReader(io.StringIO(text)), start=1):
+            if None in row:
+                raise ValueError(f"Row {i}: too many fields")
+            row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+            if not row.get('crop') or not row.get('sowing_date'):
+                raise ValueError(f"Row {i}: crop and sowing_date are required")
+            try:
+                sown = datetime.date.fromisoformat(row['sowing_date'])
+                area = float(row['area']) if row.get('area') else np.nan
+            except ValueError as e:
+                raise ValueError(f"Row {i}: {e}") from None
+            columns['name'].append(row.get('name') or f"Plot {i}")
+            columns['crop'].append(row['crop'])
+            columns['sowing_date'].append(sown)
+            columns['area'].append(area)
+            columns['soil'].append(row.get('soil') or default_soil)
+        return cls.from_columns(columns)
+
+    def durations(self, crop_durations):
+        """Season length per plot; each distinct crop is looked up once"""
+        crops, codes = np.unique(self.crop, return_inverse=True)
+        lookup = np.array([crop_durations.get(c, DEFAULT_DURATION) for c in crops], dtype=np.int64)
+        return lookup[codes.reshape(-1)]
+
+    def status(self, crop_durations, today=None):
+        today = np.datetime64(today or datetime.date.today(), 'D')
+        durations = self.durations(crop_durations)
+        days_passed = (today - self.sowing_date).astype(np.int64)
+        days_remaining = np.maximum(durations - days_passed, 0)
+        progress = np.clip(days_passed / np.maximum(durations, 1), 0.0, 1.0)
+        return HarvestStatus(days_passed, days_remaining, progress, days_remaining == 0,
+                             self.sowing_date + durations.astype('timedelta64[D]'))
+
+
+def harvest_window(status, min_days=0, max_days=None):
+    """Mask of plots whose harvest is due in [min_days, max_days] days from today"""
+    mask = status.days_remaining >= min_days
+    if max_days is not None:
+        mask &= status.days_remaining <= max_days
+    return mask
+
+
+SORT_KEYS = {
+    'harvest': lambda table, status: status.harvest_date,
+    'progress': lambda table, status: -status.progress,
+    'area': lambda table, status: -np.nan_to_num(table.area, nan=-1.0),
+    'crop': lambda table, status: table.crop.astype(str),
+}
+
+
+def order(table, status, by='harvest', mask=None):
+    """Row indices sorted by `by` (ties keep file order), optionally restricted to `mask`"""
+    rows = np.arange(len(table)) if mask is None else np.flatnonzero(mask)
+    keys = SORT_KEYS[by](table, status)[rows]
+    return rows[np.argsort(keys, kind='stable')]
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Runs batches of background generations on a small shared thread pool.
+
+    Each key has at most one generation in flight across all sessions, so a
+    foreground request for the same key can wait on `inflight(key)` instead of
+    starting a second call. A batch stops at its first failure (a quota or key
+    error will only repeat) and is cancelled when its owner submits a new one.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._inflight = {}  # key -> Future
+        self._batches = {}  # owner -> (stop Event, [Future])
+        self._lock = threading.RLock()
+
+    def submit_batch(self, owner, jobs, fn, on_result):
+        """Run fn(arg) for every (key, arg) in jobs; on_result(key, result) stores the answer"""
+        self.cancel(owner)
+        stop = threading.Event()
+        futures = []
+        with self._lock:
+            for key, arg in jobs:
+                if key in self._inflight:
+                    continue
+                future = self._executor.submit(self._run, key, arg, fn, on_result, stop)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f, key=key: self._forget(key, f))
+                futures.append(future)
+            self._batches[owner] = (stop, futures)
+        return futures
+
+    def inflight(self, key):
+        with self._lock:
+            return self._inflight.get(key)
+
+    def cancel(self, owner):
+        with self._lock:
+            stop, futures = self._batches.pop(owner, (None, []))
+            if stop is not None:
+                stop.set()
+            for future in futures:
+                future.cancel()  # Only jobs that have not started yet; running calls finish
+
+    def _run(self, key, arg, fn, on_result, stop):
+        if stop.is_set():
+            return None
+        try:
+            result = fn(arg)
+        except Exception:
+            stop.set()
+            raise
+        on_result(key, result)
+        return result
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
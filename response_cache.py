@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Case, whitespace and trailing punctuation never change the answer"""
+    return " ".join(prompt.casefold().split()).rstrip(" ?!.")
+
+
+def make_cache_key(settings, prompt, image_hash=None):
+    """Farmer context + language + normalized prompt (+ image content hash)"""
+    parts = [
+        settings.get('state'), settings.get('crop'), settings.get('soil_type'), settings.get('water_condition', 'Good'),
+        settings.get('language', 'English'), normalize_prompt(prompt), image_hash,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier answer cache: in-memory LRU in front of an on-disk SQLite table.
+
+    Both tiers honour a per-entry TTL and are bounded by entry count; the
+    least recently used entries are evicted first. Safe to share between
+    Streamlit sessions (one lock guards both tiers). A disk error (e.g. the
+    batch CLI holding the database lock) is logged and treated as a miss or
+    a memory-only store; it never reaches the caller.
+    """
+
+    def __init__(self, path, ttl=86400, max_memory_entries=512, max_disk_entries=20000):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'disk_errors': 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # The app and the batch CLI share this file
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            try:
+                row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        self._remember(key, expires_at, value)
+                        self._stats['disk_hits'] += 1
+                        self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+            except sqlite3.Error as exc:
+                self._disk_failed("get", exc)
+                if key in self._memory:
+                    return self._memory[key][1]  # Read from disk before the bookkeeping write failed
+
+            self._stats['misses'] += 1
+            return None
+
+    def contains(self, key):
+        """Whether a live entry exists, without touching the hit/miss counters"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return True
+            try:
+                row = self._db.execute("SELECT expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as exc:
+                self._disk_failed("contains", exc)
+                return False
+            return row is not None and row[0] > now
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._stats['stores'] += 1
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._trim_disk(now)
+                self._db.commit()
+            except sqlite3.Error as exc:
+                self._disk_failed("set", exc)  # Still served from memory
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _disk_failed(self, operation, exc):
+        # Caller holds the lock
+        self._stats['disk_errors'] += 1
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+        print(f"response-cache: disk {operation} failed ({exc})", file=sys.stderr)
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _trim_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self._stats['evictions'] += overflow
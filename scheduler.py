@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+INTERACTIVE, BACKGROUND = 0, 1
+
+# Upstream failures worth retrying after a pause
+TRANSIENT_ERRORS = ['429', 'quota', 'resource exhausted', 'rate limit', '500', '503', 'unavailable', 'deadline', 'timed out', 'timeout']
+
+
+class RequestShed(Exception):
+    """The call was dropped locally to keep the key's quota for farmers waiting on an answer"""
+
+
+def is_transient(error):
+    message = str(error).lower()
+    return any(code in message for code in TRANSIENT_ERRORS)
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`; a 429 empties it and blocks it for a while"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now, keep=0.0):
+        """Take a token if more than `keep` would remain. Returns 0 on success, else seconds until one is free"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens - 1 >= keep:
+            self.tokens -= 1
+            return 0.0
+        return (keep + 1 - self.tokens) / self.rate
+
+    def penalize(self, now, delay):
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + delay)
+
+
+class GeminiScheduler:
+    """Process-wide gate in front of every Gemini call.
+
+    - Per-API-key token bucket shared by all sessions using that key.
+    - Interactive calls wait for a token (up to `max_wait`) and retry
+      transient errors with full-jitter exponential backoff.
+    - Background calls (prefetches) never wait or retry: they are shed while
+      the bucket is below `background_reserve` of its capacity or cooling
+      down after a 429, so bursts hit them first.
+    - Identical concurrent calls (same `key`) share one upstream request.
+    """
+
+    def __init__(self, requests_per_minute=15, burst=5, max_retries=2, base_delay=1.0, max_delay=8.0,
+                 max_wait=30.0, background_reserve=0.2):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.background_keep = burst * background_reserve
+        self._buckets = {}
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'retries': 0, 'coalesced': 0, 'shed': 0, 'throttled_seconds': 0.0}
+
+    def submit(self, api_key, fn, key=None, priority=INTERACTIVE):
+        """Run fn() under the key's rate limit; callers passing the same `key` share one result"""
+        if key is None:
+            return self._call(api_key, fn, priority)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._call(api_key, fn, priority)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    @contextmanager
+    def leading(self, key):
+        """Claim `key` for a call made outside submit() (e.g. a stream).
+
+        Yields None if this caller now owns the key, otherwise the owner's
+        future: wait on it and re-read the result instead of calling again.
+        """
+        future = Future()
+        with self._lock:
+            existing = self._inflight.setdefault(key, future)
+            owner = existing is future
+            if not owner:
+                self._stats['coalesced'] += 1
+        try:
+            yield None if owner else existing
+        finally:
+            if owner:
+                future.set_result(None)
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def inflight(self, key):
+        with self._lock:
+            return self._inflight.get(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _call(self, api_key, fn, priority):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(api_key, priority)
+            with self._lock:
+                self._stats['calls'] += 1
+            try:
+                return fn()
+            except Exception as e:
+                if priority == BACKGROUND or attempt == self.max_retries or not is_transient(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                with self._lock:
+                    self._stats['retries'] += 1
+                    if '429' in str(e) or 'quota' in str(e).lower():
+                        # Everyone on this key backs off, not just this caller
+                        self._bucket(api_key).penalize(time.monotonic(), delay)
+                time.sleep(delay)
+
+    def _acquire(self, api_key, priority):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                keep = self.background_keep if priority == BACKGROUND else 0.0
+                wait = self._bucket(api_key).take(now, keep)
+                if wait == 0:
+                    return
+                if priority == BACKGROUND or now + wait > deadline:
+                    self._stats['shed'] += 1
+                    raise RequestShed("Local quota budget for this API key is used up (429 avoided). Please try again shortly.")
+                self._stats['throttled_seconds'] += wait
+            time.sleep(wait)
+
+    def _bucket(self, api_key):
+        # Caller holds the lock
+        bucket = self._buckets.get(api_key)
+        if bucket is None:
+            bucket = self._buckets[api_key] = TokenBucket(self.rate, self.burst)
+        return bucket
@@ -0,0 +1,35 @@
+import functools
+import json
+import os
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+
+# Display name -> catalog file in locales/
+LANGUAGE_CODES = {
+    "English": "en", "Hindi": "hi", "Marathi": "mr", "Gujarati": "gu", "Tamil": "ta", "Telugu": "te",
+    "Kannada": "kn", "Malayalam": "ml", "Bengali": "bn", "Punjabi": "pa", "Spanish": "es", "French": "fr",
+    "German": "de", "Mandarin": "zh", "Arabic": "ar", "Russian": "ru", "Portuguese": "pt",
+}
+
+
+def _read(code):
+    try:
+        with open(os.path.join(LOCALES_DIR, f"{code}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog(language):
+    """Flat key -> text dict for one language, read from disk on first use only.
+
+    English entries are merged underneath, so a missing key costs no second lookup.
+    """
+    english = _read("en")
+    code = LANGUAGE_CODES.get(language, "en")
+    return english if code == "en" else {**english, **_read(code)}
+
+
+def translate(key, language):
+    return get_catalog(language).get(key, key)
@@ -0,0 +1,242 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+SEVERE_CONDITIONS = ['thunder', 'torrential', 'heavy rain', 'snow', 'blizzard', 'flood', 'storm']
+EXTREME_HEAT_C = 40  # Current temperature that alerts whatever is planted
+
+# Crop-aware thresholds; crops missing here use the defaults
+HEAT_STRESS_C = {'Wheat': 35, 'Rice (Paddy)': 38, 'Maize (Corn)': 38, 'Sugarcane': 40,
+                 'Cotton': 40, 'Soybean': 36, 'Tomato': 35, 'Potato': 30}
+FROST_C = {'Wheat': 0, 'Sugarcane': 2, 'Cotton': 2, 'Tomato': 2, 'Potato': 1}
+DEFAULT_HEAT_STRESS_C = 38
+DEFAULT_FROST_C = 1
+HEATWAVE_DAYS = 2  # Consecutive days at or above the crop's heat-stress maximum
+RAIN_24H_MM = 50  # Wettest 24 hours in the forecast
+RAIN_TOTAL_MM = 100  # Whole forecast horizon
+
+
+class ForecastSeries(NamedTuple):
+    """One location's wttr.in forecast as parallel arrays, one entry per forecast step"""
+    current: dict  # temp_c, humidity, condition (now)
+    times: np.ndarray  # datetime64[h], local time at the location
+    temp_c: np.ndarray  # float32
+    precip_mm: np.ndarray  # float32
+    severe: np.ndarray  # bool: description matches SEVERE_CONDITIONS
+    step_hours: int
+
+
+def parse_forecast(data):
+    """ForecastSeries for a wttr.in `format=j1` payload (current conditions + hourly forecast)"""
+    now = data['current_condition'][0]
+    current = {'temp_c': float(now['temp_C']), 'humidity': int(now['humidity']),
+               'condition': now['weatherDesc'][0]['value']}
+
+    times, temp_c, precip_mm, descriptions = [], [], [], []
+    for day in data.get('weather', []):
+        for hour in day.get('hourly', []):
+            times.append(np.datetime64(day['date'], 'h') + np.timedelta64(int(hour['time']) // 100, 'h'))
+            temp_c.append(hour['tempC'])
+            precip_mm.append(hour['precipMM'])
+            descriptions.append(hour['weatherDesc'][0]['value'].lower())
+    times = np.array(times, dtype='datetime64[h]')
+    step_hours = int((times[1] - times[0]) / np.timedelta64(1, 'h')) if len(times) > 1 else 3
+    severe = np.array([any(cond in desc for cond in SEVERE_CONDITIONS) for desc in descriptions], dtype=bool)
+    return ForecastSeries(current, times, np.array(temp_c, dtype=np.float32),
+                          np.array(precip_mm, dtype=np.float32), severe, step_hours)
+
+
+def longest_run(mask):
+    """Longest run of consecutive True values in each row of a 2-D bool array"""
+    rows, cols = mask.shape
+    edges = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    starts, ends = np.nonzero(edges == 1), np.nonzero(edges == -1)
+    runs = np.zeros(rows, dtype=np.int64)
+    np.maximum.at(runs, starts[0], ends[1] - starts[1])  # Both come out row-major, so they pair up
+    return runs
+
+
+def location_alerts(series):
+    """Alerts for everyone at the location, whatever they grow"""
+    alerts = []
+    condition = series.current['condition'].lower()
+    if any(cond in condition for cond in SEVERE_CONDITIONS):
+        alerts.append(f"⚠️ SEVERE WEATHER ALERT: {condition.title()} detected in your area.")
+    elif series.current['temp_c'] > EXTREME_HEAT_C:
+        alerts.append(f"⚠️ HEATWAVE ALERT: Extreme temperatures ({series.current['temp_c']}°C) detected.")
+    elif series.severe.any():
+        first = series.times[np.argmax(series.severe)].item()
+        alerts.append(f"⚠️ SEVERE WEATHER ALERT: Storms forecast in your area from {first:%a %H:%M}.")
+
+    if len(series.precip_mm):
+        per_day = max(1, 24 // series.step_hours)
+        totals = np.concatenate(([0.0], np.cumsum(series.precip_mm, dtype=np.float64)))
+        wettest_day = (totals[per_day:] - totals[:-per_day]).max() if len(series.precip_mm) >= per_day else totals[-1]
+        if wettest_day >= RAIN_24H_MM or totals[-1] >= RAIN_TOTAL_MM:
+            alerts.append(f"🌧️ HEAVY RAIN ALERT: {totals[-1]:.0f} mm forecast ({wettest_day:.0f} mm in the wettest 24 hours). "
+                          "Clear field drainage and hold off on fertilizer.")
+    return alerts
+
+
+def crop_alerts(series, crops, sowing_dates, harvest_dates):
+    """Heatwave and frost alerts for a set of plots, all plots x forecast steps in one pass.
+
+    Only forecast steps between a plot's sowing and harvest dates count,
+    so frost after the harvest (or before sowing) is no concern.
+    """
+    if not len(series.times) or not len(crops):
+        return []
+    crops = np.asarray(crops, dtype=object)
+    names, codes = np.unique(crops, return_inverse=True)
+    codes = codes.reshape(-1)
+    heat_limit = np.array([HEAT_STRESS_C.get(c, DEFAULT_HEAT_STRESS_C) for c in names], dtype=np.float32)[codes]
+    frost_limit = np.array([FROST_C.get(c, DEFAULT_FROST_C) for c in names], dtype=np.float32)[codes]
+
+    sown = np.asarray(sowing_dates, dtype='datetime64[D]').astype('datetime64[h]')
+    harvest = np.asarray(harvest_dates, dtype='datetime64[D]').astype('datetime64[h]')
+    in_field = (series.times[None, :] >= sown[:, None]) & (series.times[None, :] < harvest[:, None])  # plots x steps
+
+    # Heatwave: consecutive days whose forecast maximum reaches the crop's limit
+    per_day = max(1, 24 // series.step_hours)
+    days = len(series.temp_c) // per_day
+    daily_max = series.temp_c[:days * per_day].reshape(days, per_day).max(axis=1)
+    in_field_days = in_field[:, :days * per_day].reshape(len(crops), days, per_day).any(axis=2)
+    hot_run = longest_run((daily_max[None, :] >= heat_limit[:, None]) & in_field_days)
+    heatwave = hot_run >= HEATWAVE_DAYS
+
+    frost = ((series.temp_c[None, :] <= frost_limit[:, None]) & in_field).any(axis=1)
+
+    alerts = []
+    if heatwave.any():
+        alerts.append(f"🔥 HEATWAVE ALERT: {daily_max.max():.0f}°C for {hot_run.max()} days in a row "
+                      f"stresses {_affected(crops, heatwave)}. Irrigate early morning and mulch.")
+    if frost.any():
+        alerts.append(f"❄️ FROST ALERT: {series.temp_c.min():.0f}°C forecast before harvest for {_affected(crops, frost)}. "
+                      "Irrigate the evening before and cover seedlings.")
+    return alerts
+
+
+def _affected(crops, mask):
+    count = int(mask.sum())
+    kinds = ", ".join(np.unique(crops[mask]).tolist())
+    return f"your {kinds}" if count == 1 else f"{count} plots ({kinds})"
+
+
+class WeatherService:
+    """Per-location forecast table kept fresh in the background (stale-while-revalidate).
+
+    `get` never waits on the network for a location it has seen before: a
+    stale value is returned at once and a refresh is queued. Only a location's
+    very first lookup waits, and at most `timeout` seconds. A daemon thread
+    refreshes entries before they go stale and forgets locations nobody has
+    asked about for `idle_ttl` seconds. All fetches share one keep-alive
+    connection pool.
+    """
+
+    def __init__(self, ttl=1800, timeout=3, idle_ttl=86400, workers=4):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.idle_ttl = idle_ttl
+        self._entries = {}  # location -> {'series', 'fetched_at', 'used_at'}
+        self._inflight = {}  # location -> Future
+        self._lock = threading.Lock()
+        self._stats = {'fetches': 0, 'failures': 0, 'stale_served': 0, 'total_latency': 0.0, 'last_latency': None}
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weather")
+        threading.Thread(target=self._refresh_loop, name="weather-refresher", daemon=True).start()
+
+    def get(self, location):
+        """The location's ForecastSeries, or None if it has never been fetched successfully"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(location)
+            if entry is not None:
+                entry['used_at'] = now
+                if now - entry['fetched_at'] > self.ttl:
+                    self._stats['stale_served'] += 1
+                    self._schedule(location)
+                    metrics.span("weather.lookup", cache="stale").finish()
+                else:
+                    metrics.span("weather.lookup", cache="hit").finish()
+                return entry['series']
+            metrics.span("weather.lookup", cache="miss").finish()
+            future = self._schedule(location)
+        try:
+            return future.result(timeout=self.timeout)
+        except Exception:
+            return None
+
+    def invalidate(self, location):
+        """Refetch one location in the background; every other entry is untouched"""
+        with self._lock:
+            if location in self._entries:
+                self._entries[location]['fetched_at'] = 0
+            self._schedule(location)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['locations'] = len(self._entries)
+        stats['avg_latency'] = stats['total_latency'] / stats['fetches'] if stats['fetches'] else None
+        return stats
+
+    def _schedule(self, location):
+        # Caller holds the lock; one fetch per location at a time
+        future = self._inflight.get(location)
+        if future is None:
+            future = self._executor.submit(self._fetch, location)
+            self._inflight[location] = future
+        return future
+
+    def _fetch(self, location):
+        started = time.perf_counter()
+        series, ok = None, False
+        with metrics.span("weather.fetch") as fetch_span:
+            try:
+                sanitized_loc = location.replace(" ", "+")
+                response = self._session.get(f"https://wttr.in/{sanitized_loc}?format=j1", timeout=self.timeout)
+                fetch_span.set(bytes_in=len(response.content))
+                if response.status_code == 200:
+                    series, ok = parse_forecast(response.json()), True
+            except Exception:
+                pass
+            fetch_span.set(outcome="ok" if ok else "error")
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            self._inflight.pop(location, None)
+            self._stats['fetches'] += 1
+            self._stats['total_latency'] += latency
+            self._stats['last_latency'] = latency
+            now = time.time()
+            entry = self._entries.get(location)
+            if ok:
+                self._entries[location] = {'series': series, 'fetched_at': now, 'used_at': entry['used_at'] if entry else now}
+            else:
+                self._stats['failures'] += 1
+                if entry is None:
+                    entry = self._entries[location] = {'series': None, 'used_at': now}
+                entry['fetched_at'] = now - self.ttl + 60  # Keep the old forecast, retry in a minute
+                series = entry['series']
+        return series
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(60)
+            now = time.time()
+            with self._lock:
+                for location, entry in list(self._entries.items()):
+                    if now - entry['used_at'] > self.idle_ttl:
+                        del self._entries[location]
+                    elif now - entry['fetched_at'] > self.ttl * 0.9:
+                        self._schedule(location)